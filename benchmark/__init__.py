@@ -0,0 +1,8 @@
+#
+#  QIRC benchmarks
+#
+#  Each script in this directory runs on its own; see the comment at
+#  the top of each. "python -m benchmark" runs the suite against the
+#  stand-in server in benchmark/server.py and saves the results as
+#  JSON.
+#
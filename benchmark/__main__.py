@@ -0,0 +1,304 @@
+#
+#  QIRC benchmark suite
+#
+#  Starts the stand-in server (benchmark/server.py) in a process of
+#  its own, so what's measured here is the client alone, and runs:
+#
+#  - flood: a PRIVMSG flood; lines/s parsed and dispatched, and
+#    latency from the server writing each line to the client's
+#    message_public event (where QIRC emits its signal)
+#  - names: a NAMES reply for 50,000 users, up to user_list
+#  - netsplit: those users all QUIT at once
+#  - whois: a burst of WHOIS lookups for different users, from
+#    whois() to the reply
+#  - motd: a 10,000 line MOTD, up to server_motd
+#  - queue: PRIVMSGs sent with flood_protection on; latency from
+#    privmsg() to the server, and the rate they went out at
+#  - connections: many clients on a ConnectionManager, each taking a
+#    short flood; CPU time and memory per connection
+#
+#  Each scenario runs in a process of its own. CPU time is the
+#  client's event loop thread's, except for connections, which is the
+#  whole process's. Results are printed and
+#  saved as JSON, by default to qirc-VERSION.json, to compare with
+#  another run's file given to --compare.
+#
+#  Usage: python -m benchmark [--scale SCALE] [--output FILE]
+#                             [--compare FILE] [SCENARIO...]
+#
+
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import argparse
+import threading
+import subprocess
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient, ConnectionManager, QIRC_VERSION
+from benchmark.server import percentile
+
+CHANNEL = "#bench"
+
+class ServerProcess:
+
+	def __init__(self):
+		self.process = subprocess.Popen([sys.executable,"-m","benchmark.server"],stdout=subprocess.PIPE,text=True,cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+		self.port = int(self.process.stdout.readline().split()[1])
+
+	def stop(self):
+		self.process.terminate()
+		self.process.wait()
+
+def connect(port,**settings):
+	# A registered client, on a thread of its own
+	settings.setdefault("flood_protection",False)
+	client = IRCClient(server="127.0.0.1",port=port,nickname="qirc",**settings)
+	registered = threading.Event()
+	client.on("server_register",lambda data: registered.set())
+	thread = threading.Thread(target=asyncio.run,args=(client.connect_and_run(),),daemon=True)
+	thread.start()
+	if not registered.wait(30): raise RuntimeError("the stand-in server didn't register the client")
+	return client, thread
+
+def disconnect(client,thread):
+	client.stop()
+	thread.join(10)
+
+def join(client,channel):
+	joined = threading.Event()
+	def listed(data):
+		if data["channel"]==channel: joined.set()
+	client.on("user_list",listed)
+	client.join(channel)
+	joined.wait(30)
+	client.off("user_list",listed)
+
+def cpu_time(client):
+	# CPU time used so far by the client's event loop thread
+	future = concurrent.futures.Future()
+	client._call_soon(lambda: future.set_result(time.thread_time()))
+	return future.result(30)
+
+def latencies(samples):
+	samples = sorted(samples)
+	return { "p50": percentile(samples,50)*1000, "p90": percentile(samples,90)*1000, "p99": percentile(samples,99)*1000, "max": percentile(samples,100)*1000 }
+
+def wait_for(client,event,until,send,timeout=300):
+	# Sends send, then waits for until(data) to be true of an event;
+	# returns (seconds,CPU seconds)
+	done = threading.Event()
+	def check(data):
+		if until(data): done.set()
+	client.on(event,check)
+	cpu = cpu_time(client)
+	start = time.perf_counter()
+	client.send(send)
+	if not done.wait(timeout): raise RuntimeError(f"timed out waiting for {event}")
+	elapsed = time.perf_counter() - start
+	client.off(event,check)
+	return elapsed, cpu_time(client) - cpu
+
+def rss():
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		return 0
+
+def peak_rss():
+	try:
+		import resource
+	except ImportError:
+		return 0
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak if sys.platform=="darwin" else peak*1024
+
+def flood(port,scale):
+	count = int(100000*scale)
+	client, thread = connect(port)
+	samples = []
+	def received(data):
+		samples.append(time.perf_counter() - float(data["message"].split(" ",1)[0]))
+	client.on("message_public",received)
+	elapsed, cpu = wait_for(client,"message_public",lambda data: len(samples)==count,f"BENCH PRIVMSG {count} {CHANNEL}")
+	disconnect(client,thread)
+	return { "lines": count, "lines_per_second": count/elapsed, "cpu_seconds": cpu, "latency_ms": latencies(samples) }
+
+def names(port,scale):
+	count = int(50000*scale)
+	client, thread = connect(port)
+	join(client,CHANNEL)
+	elapsed, cpu = wait_for(client,"user_list",lambda data: len(data["users"])>=count,f"BENCH NAMES {count} {CHANNEL}")
+	lines = (count+7) // 8 + 1
+	disconnect(client,thread)
+	return { "users": count, "lines": lines, "lines_per_second": lines/elapsed, "seconds": elapsed, "cpu_seconds": cpu }
+
+def netsplit(port,scale):
+	count = int(50000*scale)
+	client, thread = connect(port)
+	join(client,CHANNEL)
+	wait_for(client,"user_list",lambda data: len(data["users"])>=count,f"BENCH NAMES {count} {CHANNEL}")
+	quits = [0]
+	def quit(data):
+		quits[0] = quits[0] + 1
+	client.on("user_quit",quit)
+	elapsed, cpu = wait_for(client,"user_quit",lambda data: quits[0]==count,f"BENCH NETSPLIT {count} {CHANNEL}")
+	left = len(client.channel_members(CHANNEL))
+	disconnect(client,thread)
+	return { "quits": count, "lines_per_second": count/elapsed, "seconds": elapsed, "cpu_seconds": cpu, "members_left": left }
+
+def whois(port,scale):
+	count = int(2000*scale)
+	client, thread = connect(port)
+	samples = []
+	done = threading.Event()
+	cpu = cpu_time(client)
+	start = time.perf_counter()
+	for i in range(count):
+		def answered(future,sent=time.perf_counter()):
+			samples.append(time.perf_counter() - sent)
+			if len(samples)==count: done.set()
+		client.whois(f"user{i}",cached=False).add_done_callback(answered)
+	done.wait(300)
+	elapsed = time.perf_counter() - start
+	cpu = cpu_time(client) - cpu
+	disconnect(client,thread)
+	return { "lookups": count, "lookups_per_second": count/elapsed, "cpu_seconds": cpu, "latency_ms": latencies(samples) }
+
+def motd(port,scale):
+	count = int(10000*scale)
+	client, thread = connect(port)
+	elapsed, cpu = wait_for(client,"server_motd",lambda data: data.count("\n")+1>=count,f"BENCH MOTD {count}")
+	disconnect(client,thread)
+	return { "lines": count, "lines_per_second": count/elapsed, "seconds": elapsed, "cpu_seconds": cpu }
+
+def queue(port,scale):
+	count = int(200*scale)
+	rate = 0.01
+	client, thread = connect(port,flood_protection=True,flood_protection_send_rate=rate,queue_limit=0,queue_target_limit=0)
+	reply = []
+	def replied(data):
+		if data["message"].startswith("latency "): reply.append([float(value) for value in data["message"].split()[2:]])
+	client.on("message_private",replied)
+	start = time.perf_counter()
+	for i in range(count):
+		client.privmsg(CHANNEL,f"{time.perf_counter():.6f} queued {i}")
+	wait_for(client,"message_private",lambda data: data["message"].startswith("latency "),f"BENCH LATENCY {count}")
+	elapsed = time.perf_counter() - start
+	disconnect(client,thread)
+	p50, p90, p99, longest = reply[0]
+	return { "lines": count, "send_rate": rate, "lines_per_second": count/elapsed, "latency_ms": { "p50": p50*1000, "p90": p90*1000, "p99": p99*1000, "max": longest*1000 } }
+
+def connections(port,scale):
+	count = max(1,int(200*scale))
+	messages = 100
+	resident = rss()
+	peak = peak_rss()
+	cpu = time.process_time()
+
+	manager = ConnectionManager(threads=1)
+	done = threading.Event()
+	remaining = [count]
+	lock = threading.Lock()
+	for i in range(count):
+		client = IRCClient(server="127.0.0.1",port=port,nickname=f"bench{i}",flood_protection=False)
+		received = [0]
+		def counted(data,received=received):
+			received[0] = received[0] + 1
+			if received[0]==messages:
+				with lock:
+					remaining[0] = remaining[0] - 1
+					if remaining[0]==0: done.set()
+		client.on("message_public",counted)
+		client.on("server_register",lambda data: data["client"].send(f"BENCH PRIVMSG {messages} {CHANNEL}"))
+		manager.add(client)
+
+	start = time.perf_counter()
+	manager.start()
+	done.wait(300)
+	elapsed = time.perf_counter() - start
+	cpu = time.process_time() - cpu
+	resident = rss() - resident
+	peak = peak_rss() - peak
+	manager.stop()
+	return { "connections": count, "seconds": elapsed, "cpu_ms_per_connection": cpu/count*1000, "rss_kb_per_connection": resident/count/1024, "peak_rss_kb_per_connection": peak/count/1024 }
+
+SCENARIOS = { "flood": flood, "names": names, "netsplit": netsplit, "whois": whois, "motd": motd, "queue": queue, "connections": connections }
+
+def flatten(results,prefix=""):
+	flat = {}
+	for key, value in results.items():
+		if isinstance(value,dict):
+			flat.update(flatten(value,prefix+key+"."))
+		else:
+			flat[prefix+key] = value
+	return flat
+
+def report(name,results,previous=None):
+	print(name)
+	previous = flatten(previous or {})
+	for key, value in flatten(results).items():
+		line = f"  {key:<32} {value:>14.3f}" if isinstance(value,float) else f"  {key:<32} {value:>14}"
+		old = previous.get(key)
+		if isinstance(old,(int,float)) and old:
+			line = line + f"   {value/old:>6.2f}x of {old:.3f}"
+		print(line)
+
+def run_scenario(name,port,scale):
+	# Each scenario runs in a fresh process, so its CPU time and peak
+	# memory aren't muddied by the ones before it
+	command = [sys.executable,"-m","benchmark",name,"--scale",str(scale),"--port",str(port)]
+	process = subprocess.run(command,stdout=subprocess.PIPE,text=True,cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+	if process.returncode!=0: raise RuntimeError(f"{name} failed")
+	return json.loads(process.stdout.splitlines()[-1])
+
+def main():
+	parser = argparse.ArgumentParser(prog="python -m benchmark",description="Runs the QIRC benchmark suite against a local stand-in server.")
+	parser.add_argument("scenarios",nargs="*",metavar="SCENARIO",help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+	parser.add_argument("--scale",type=float,default=1,help="multiplies every scenario's size")
+	parser.add_argument("--output",default=f"qirc-{QIRC_VERSION}.json",help="where to save the results")
+	parser.add_argument("--compare",help="a results file from another run to compare with")
+	parser.add_argument("--port",type=int,help=argparse.SUPPRESS)
+	arguments = parser.parse_args()
+	for name in arguments.scenarios:
+		if name not in SCENARIOS: parser.error(f"no such scenario: {name}")
+
+	if arguments.port!=None:
+		# Run by run_scenario(): one scenario, results to stdout
+		name = arguments.scenarios[0]
+		print(json.dumps(SCENARIOS[name](arguments.port,arguments.scale)))
+		return
+
+	previous = {}
+	if arguments.compare:
+		with open(arguments.compare) as f:
+			previous = json.load(f)["scenarios"]
+
+	server = ServerProcess()
+	results = {
+		"qirc_version": QIRC_VERSION,
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"time": time.strftime("%Y-%m-%dT%H:%M:%SZ",time.gmtime()),
+		"scale": arguments.scale,
+		"scenarios": {}
+	}
+	try:
+		for name in arguments.scenarios or SCENARIOS:
+			results["scenarios"][name] = run_scenario(name,server.port,arguments.scale)
+			report(name,results["scenarios"][name],previous.get(name))
+	finally:
+		server.stop()
+
+	with open(arguments.output,"w") as f:
+		json.dump(results,f,indent=2)
+	print(f"Saved to {arguments.output}")
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,165 @@
+#
+#  QIRC IRCv3 capability benchmark
+#
+#  Runs a local stand-in server that offers multi-prefix,
+#  userhost-in-names, away-notify, account-notify, extended-join,
+#  chghost, message-tags, server-time and batch (with a multi-line
+#  CAP LS 302 reply), joins the client to a channel of USERS users and
+#  then pushes ROUNDS rounds of away, account and host changes for a
+#  tenth of them, with server-time tags and in netsplit-style batches.
+#
+#  The report checks the client negotiated every capability and that
+#  what it tracked matches the server, then compares the traffic the
+#  pushed changes cost with what polling the channel with WHO once a
+#  round would have cost to learn the same.
+#
+#  Usage: python benchmark/cap_negotiation.py [USERS] [ROUNDS]
+#
+
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient, WANTED_CAPS
+
+OFFERED = ["multi-prefix", "userhost-in-names", "away-notify", "account-notify", "extended-join", "chghost", "message-tags", "server-time", "batch"]
+CHANNEL = "#qirc"
+
+class StandInServer:
+
+	def __init__(self,users,rounds):
+		random.seed(0)
+		self.users = { f"user{i}": { "username": "ident", "host": f"host{i}.example.com", "account": None, "away": None } for i in range(users) }
+		self.rounds = rounds
+		self.pushed = 0
+		self.polled = 0
+		self.done = threading.Event()
+		self.loop = asyncio.new_event_loop()
+		ready = threading.Event()
+		def run():
+			asyncio.set_event_loop(self.loop)
+			server = self.loop.run_until_complete(asyncio.start_server(self._client,"127.0.0.1",0))
+			self.port = server.sockets[0].getsockname()[1]
+			ready.set()
+			self.loop.run_forever()
+		threading.Thread(target=run,daemon=True).start()
+		ready.wait()
+
+	def tags(self,batch):
+		return "@time=" + time.strftime("%Y-%m-%dT%H:%M:%S.000Z",time.gmtime()) + ";batch=" + batch + " "
+
+	async def _client(self,reader,writer):
+		def send(line):
+			writer.write((line + "\r\n").encode())
+		nickname = "qirc"
+		while True:
+			line = await reader.readline()
+			if not line: break
+			words = line.decode().strip().split(" ")
+			command = words[0].upper()
+			if command=="CAP" and words[1]=="LS":
+				send(f":stand.in CAP * LS * :{' '.join(OFFERED[:5])}")
+				send(f":stand.in CAP * LS :{' '.join(OFFERED[5:])} sasl=PLAIN")
+			elif command=="CAP" and words[1]=="REQ":
+				requested = " ".join(words[2:]).lstrip(":").split()
+				if all(cap in OFFERED for cap in requested):
+					send(f":stand.in CAP {nickname} ACK :{' '.join(requested)}")
+				else:
+					send(f":stand.in CAP {nickname} NAK :{' '.join(requested)}")
+			elif command=="NICK":
+				nickname = words[1]
+			elif command=="CAP" and words[1]=="END":
+				send(f":stand.in 001 {nickname} :Welcome {nickname}!qirc@client.example.com")
+			elif command=="JOIN":
+				send(f":{nickname}!qirc@client.example.com JOIN {CHANNEL} * :qirc")
+				entries = [f"@+{nick}!{user['username']}@{user['host']}" if n%50==0 else f"{nick}!{user['username']}@{user['host']}" for n, (nick, user) in enumerate(self.users.items())]
+				for i in range(0,len(entries),10):
+					send(f":stand.in 353 {nickname} = {CHANNEL} :{' '.join(entries[i:i+10])}")
+				send(f":stand.in 366 {nickname} {CHANNEL} :End of /NAMES list.")
+				await writer.drain()
+				await self._push(send,writer)
+		writer.close()
+
+	async def _push(self,send,writer):
+		names = list(self.users)
+		for round in range(self.rounds):
+			lines = []
+			batch = f"netsplit{round}"
+			lines.append(f":stand.in BATCH +{batch} netsplit stand.in other.stand.in")
+			for nick in random.sample(names,len(names)//10):
+				user = self.users[nick]
+				mask = f"{nick}!{user['username']}@{user['host']}"
+				change = random.randrange(3)
+				if change==0:
+					user["away"] = None if user["away"] else f"away {round}"
+					lines.append(self.tags(batch) + f":{mask} AWAY" + (f" :{user['away']}" if user["away"] else ""))
+				elif change==1:
+					user["account"] = None if user["account"] else f"acct_{nick}"
+					lines.append(self.tags(batch) + f":{mask} ACCOUNT {user['account'] or '*'}")
+				else:
+					user["host"] = f"cloaked{round}.{nick}.example.com"
+					lines.append(self.tags(batch) + f":{mask} CHGHOST {user['username']} {user['host']}")
+			lines.append(f":stand.in BATCH -{batch}")
+			for line in lines:
+				send(line)
+				self.pushed = self.pushed + len(line) + 2
+
+			# What one WHO poll of the channel would have sent instead
+			for nick, user in self.users.items():
+				flags = "G" if user["away"] else "H"
+				reply = f":stand.in 354 qirc 152 {CHANNEL} {user['username']} {user['host']} {nick} {flags} {user['account'] or '0'} :realname"
+				self.polled = self.polled + len(reply) + 2
+			self.polled = self.polled + len(f":stand.in 315 qirc {CHANNEL} :End of /WHO list.") + 2
+			await writer.drain()
+
+		send(f":stand.in PRIVMSG {CHANNEL} :done")
+		await writer.drain()
+
+def main(users,rounds):
+	server = StandInServer(users,rounds)
+	client = IRCClient(server="127.0.0.1",port=server.port,nickname="qirc",flood_protection=False)
+
+	events = { "user_away": 0, "user_account": 0, "user_host": 0, "server_batch": 0 }
+	for event in events:
+		def count(data,event=event):
+			events[event] = events[event] + 1
+		client.on(event,count)
+	caps = []
+	client.on("server_caps",lambda data: caps.append(data["caps"]))
+	client.on("server_register",lambda data: client.join(CHANNEL))
+	client.on("message_public",lambda data: server.done.set())
+
+	thread = threading.Thread(target=asyncio.run,args=(client.connect_and_run(),),daemon=True)
+	start = time.perf_counter()
+	thread.start()
+	server.done.wait(60)
+	elapsed = time.perf_counter() - start
+
+	mismatched = 0
+	for nick, user in server.users.items():
+		info = client.user_info(nick)
+		if info==None or info["host"]!=user["host"] or info["account"]!=user["account"] or info["away"]!=(user["away"]!=None):
+			mismatched = mismatched + 1
+
+	client.stop()
+	thread.join(10)
+
+	wanted = [cap for cap in WANTED_CAPS if cap in OFFERED]
+	print(f"Negotiated: {' '.join(caps[0]) if caps else 'nothing'}")
+	print(f"All offered capabilities enabled: {caps!=[] and sorted(caps[0])==sorted(wanted)}")
+	print(f"{users} users, {rounds} rounds in {elapsed:.2f}s: {events['user_away']} away, {events['user_account']} account, {events['user_host']} host changes, {events['server_batch']} batch events")
+	print(f"Users tracked differently from the server: {mismatched}")
+	print(f"Pushed changes: {server.pushed/1024:>8.1f} KB")
+	print(f"WHO polling:    {server.polled/1024:>8.1f} KB, {server.polled/max(server.pushed,1):.1f}x as much")
+
+if __name__ == '__main__':
+
+	users = int(sys.argv[1]) if len(sys.argv)>1 else 1000
+	rounds = int(sys.argv[2]) if len(sys.argv)>2 else 20
+
+	main(users,rounds)
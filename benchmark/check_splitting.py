@@ -0,0 +1,87 @@
+#
+#  QIRC message splitting checks
+#
+#  Checks split_text() and format_message() on the awkward cases:
+#  cuts next to multibyte characters, runs with no spaces, leading and
+#  doubled spaces, other encodings and CTCP ACTIONs. Every piece must
+#  fit its limit and no text may be lost. Prints each failure and
+#  exits with status 1 if there were any.
+#
+#  Usage: python benchmark/check_splitting.py
+#         python -m benchmark.check_splitting
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient, split_text
+
+failures = []
+
+def check(condition,description):
+	if not condition:
+		failures.append(description)
+	return condition
+
+def check_split(text,limit,encoding="utf-8"):
+	pieces = split_text(text,limit,encoding)
+	name = f"split_text({text[:20]!r}..., {limit}, {encoding!r})"
+	for piece in pieces:
+		check(len(piece.encode(encoding))<=limit,f"{name}: {piece[:40]!r}... is over {limit} bytes")
+		check(piece.strip(" "),f"{name}: empty piece in {pieces!r}")
+	check("".join(pieces).replace(" ","")==text.replace(" ","").replace("\n",""),f"{name}: text lost, got {pieces!r}")
+	return pieces
+
+def check_splitting():
+	# Cuts that would land inside a multibyte character
+	for character in ("é", "日", "😀"):
+		for limit in range(16,24):
+			check_split(character*100,limit)
+			check_split("ab " + character*100,limit)
+
+	# No spaces at all
+	pieces = check_split("x"*1000,100)
+	check(pieces==["x"*100]*10,f"a run of 1000 x's split into {pieces!r}")
+
+	# Leading, trailing and doubled spaces
+	for text, limit, expected in (
+		("  lead", 3, ["lea","d"]),
+		("a   b", 1, ["a","b"]),
+		("   \n \nword  ", 4, ["word"]),
+	):
+		pieces = split_text(text,limit)
+		check(pieces==expected,f"split_text({text!r}, {limit}) gave {pieces!r}, not {expected!r}")
+	check_split("two  spaces  between  words  "*20,17)
+
+	# Other encodings, by bisection
+	for encoding in ("shift_jis", "cp1252", "utf-16-le"):
+		check_split("日本語 テキスト"*50 if encoding!="cp1252" else "café naïve "*50,21,encoding)
+
+	# CTCP ACTIONs are framed again in every piece
+	client = IRCClient(server="localhost",port=6667,nickname="qirc")
+	client.userhost = "qirc@host.example.com"
+	action = "\x01ACTION " + " ".join(["waves"]*200) + "\x01"
+	lines = client.format_message("PRIVMSG","#qirc",action)
+	check(len(lines)>1,"a long ACTION was not split")
+	prefix = client._prefix_estimate()
+	words = []
+	for line in lines:
+		check(len((prefix + line).encode("utf-8"))<=510,f"ACTION line is over 510 bytes: {line[:60]!r}...")
+		check(line.startswith("PRIVMSG #qirc :\x01ACTION ") and line.endswith("\x01"),f"ACTION line is not framed: {line!r}")
+		check(line.count("\x01")==2,f"ACTION line has stray \\x01s: {line!r}")
+		words.extend(line[len("PRIVMSG #qirc :\x01ACTION "):-1].split())
+	check(words==["waves"]*200,"words were lost splitting an ACTION")
+	lines = client.format_message("PRIVMSG","#qirc","\x01VERSION\x01")
+	check(lines==["PRIVMSG #qirc :\x01VERSION\x01"],f"a short CTCP was changed: {lines!r}")
+
+if __name__ == '__main__':
+
+	check_splitting()
+
+	for failure in failures:
+		print("FAIL:",failure)
+	if failures:
+		sys.exit(1)
+	print("All splitting checks passed")
@@ -0,0 +1,113 @@
+#
+#  QIRC connection scaling benchmark
+#
+#  Connects 1, 50 and 500 clients to the stand-in IRC server in
+#  benchmark/server.py, which welcomes each one and then sends it a
+#  burst of channel messages, and reports how long it took for every
+#  client to be registered and to receive its whole burst, plus the
+#  threads and resident memory used.
+#
+#  "threaded" runs each client on its own thread and event loop, the
+#  way QIRC does; "manager" multiplexes all of them with a
+#  ConnectionManager on 1 thread and on 4.
+#
+#  Usage: python benchmark/connection_scaling.py [MESSAGES] [COUNTS...]
+#
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient, ConnectionManager
+from benchmark.server import StandInServer
+
+def flood_on_register(messages):
+	# Sends every client MESSAGES lines of channel traffic once it's
+	# registered
+	def flood(session):
+		asyncio.ensure_future(session.flood(messages,"#bench"))
+	return flood
+
+def rss():
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		return 0
+
+def make_clients(port,count,messages,done):
+	clients = []
+	remaining = [count]
+	lock = threading.Lock()
+	for i in range(count):
+		client = IRCClient(server="127.0.0.1",port=port,nickname=f"bench{i}",flood_protection=False)
+		received = [0]
+		def counted(data,received=received):
+			received[0] = received[0] + 1
+			if received[0]==messages:
+				with lock:
+					remaining[0] = remaining[0] - 1
+					if remaining[0]==0: done.set()
+		client.on("message_public",counted)
+		clients.append(client)
+	return clients
+
+def run_threaded(clients):
+	threads = []
+	for client in clients:
+		thread = threading.Thread(target=asyncio.run,args=(client.connect_and_run(),),daemon=True)
+		thread.start()
+		threads.append(thread)
+	def stop():
+		for client in clients: client.stop()
+		for thread in threads: thread.join(10)
+	return stop
+
+def run_manager(threads):
+	def start(clients):
+		manager = ConnectionManager(threads=threads)
+		for client in clients: manager.add(client)
+		manager.start()
+		return manager.stop
+	return start
+
+def measure(server,run,count,messages):
+	done = threading.Event()
+	clients = make_clients(server.port,count,messages,done)
+	threads = threading.active_count()
+	resident = rss()
+
+	start = time.perf_counter()
+	stop = run(clients)
+	finished = done.wait(120)
+	elapsed = time.perf_counter() - start
+
+	threads = threading.active_count() - threads
+	resident = rss() - resident
+	stop()
+	return finished, elapsed, threads, resident
+
+def report(name,count,messages,finished,elapsed,threads,resident):
+	if not finished:
+		print(f"{name:>10} {count:>4}: timed out")
+		return
+	print(f"{name:>10} {count:>4}: {elapsed:>6.2f}s, {count*messages/elapsed:>9.0f} lines/s, {threads:>4} threads, {resident/1024/1024:>6.1f} MB RSS")
+
+if __name__ == '__main__':
+
+	messages = int(sys.argv[1]) if len(sys.argv)>1 else 1000
+	counts = [int(count) for count in sys.argv[2:]] or [1, 50, 500]
+
+	server = StandInServer(on_register=flood_on_register(messages))
+	print(f"{messages} messages per connection")
+
+	for count in counts:
+		report("threaded",count,messages,*measure(server,run_threaded,count,messages))
+		report("manager/1",count,messages,*measure(server,run_manager(1),count,messages))
+		report("manager/4",count,messages,*measure(server,run_manager(4),count,messages))
+
+	server.stop()
@@ -0,0 +1,61 @@
+#
+#  QIRC dispatch cost micro-benchmark
+#
+#  Times IRCClient._dispatch() for one representative line of each
+#  command and numeric QIRC handles, plus a few it ignores, and
+#  reports the cost per line. With the dispatch table every command
+#  costs the same lookup, so numerics late in the old if-chain
+#  (errors, WHOIS) should no longer cost more than PING.
+#
+#  Usage: python benchmark/dispatch_cost.py [REPEAT]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+
+LINES = [
+	"PING :irc.example.com",
+	":irc.example.com 001 qirc :Welcome to the network",
+	":nick!user@host.example.com PRIVMSG #qirc :hello everyone",
+	":nick!user@host.example.com JOIN :#qirc",
+	":nick!user@host.example.com PART #qirc :bye",
+	":nick!user@host.example.com QUIT :Quit: leaving",
+	":nick!user@host.example.com NICK :newnick",
+	":irc.example.com 353 qirc = #qirc :@op +voice user",
+	":irc.example.com 372 qirc :- message of the day",
+	":irc.example.com 311 qirc nick user host.example.com * :Real Name",
+	":irc.example.com 318 qirc nick :End of /WHOIS list.",
+	":irc.example.com 401 qirc nobody :No such nick/channel",
+	":irc.example.com 502 qirc :Cant change mode for other users",
+	":irc.example.com 005 qirc CHANTYPES=# :are supported by this server",
+	":irc.example.com NOTICE qirc :ignored command",
+]
+
+class NullTransport:
+
+	def write(self,data):
+		pass
+
+def measure(client,line,repeat):
+	dispatch = client._dispatch
+	start = time.perf_counter()
+	for i in range(repeat):
+		dispatch(line)
+	return (time.perf_counter() - start) / repeat
+
+if __name__ == '__main__':
+
+	repeat = int(sys.argv[1]) if len(sys.argv)>1 else 20000
+
+	client = IRCClient(server="localhost",port=6667)
+	client._transport = NullTransport()
+
+	for line in LINES:
+		cost = measure(client,line,repeat)
+		command = line.split()[0] if line[0]!=":" else line.split()[1]
+		print(f"{command:>8}: {cost*1000000000:>8.0f} ns/line")
@@ -0,0 +1,81 @@
+#
+#  QIRC dispatch throughput benchmark
+#
+#  Replays a burst of server traffic through QIRC's line dispatcher
+#  in 4096 byte chunks, the same way the client receives it, and
+#  reports lines handled per second and per read.
+#
+#  "before" handles a single line per read, like QIRC 0.0140 did;
+#  "after" drains every complete line per read, up to the
+#  max_lines_per_read cap.
+#
+#  Usage: python benchmark/dispatch_throughput.py [LINES]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+
+CHUNK_SIZE = 4096
+
+class NullTransport:
+
+	def write(self,data):
+		pass
+
+def build_burst(count):
+	lines = []
+	for i in range(count):
+		m = i % 4
+		if m==0:
+			lines.append(f":user{i}!ident@host{i}.example.com PRIVMSG #qirc :message number {i}\r\n")
+		elif m==1:
+			lines.append(f":user{i}!ident@host{i}.example.com JOIN :#qirc\r\n")
+		elif m==2:
+			lines.append(f":user{i}!ident@host{i}.example.com PART #qirc :bye\r\n")
+		else:
+			lines.append(f":user{i}!ident@host{i}.example.com QUIT :Quit: leaving\r\n")
+	data = "".join(lines).encode("utf-8")
+	return [data[i:i+CHUNK_SIZE] for i in range(0,len(data),CHUNK_SIZE)]
+
+def replay(chunks,limit,drain):
+	client = IRCClient(server="localhost",port=6667)
+	client._transport = NullTransport()
+	client._buffer = bytearray()
+
+	handled = 0
+	dispatch = client._dispatch
+	def counted(line):
+		nonlocal handled
+		handled = handled + 1
+		dispatch(line)
+	client._dispatch = counted
+
+	reads = 0
+	start = time.perf_counter()
+	for chunk in chunks:
+		reads = reads + 1
+		client._buffer += chunk
+		if drain:
+			while client._process_buffer(limit): pass
+		else:
+			client._process_buffer(limit)
+	elapsed = time.perf_counter() - start
+
+	backlog = client._buffer.count(b"\n")
+	return handled, reads, backlog, elapsed
+
+def report(name,handled,reads,backlog,elapsed):
+	print(f"{name:>8}: {handled:>8} lines in {elapsed:.3f}s, {handled/elapsed:>10.0f} lines/s, {handled/reads:>6.1f} lines/read, {backlog} lines left in buffer")
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 100000
+	chunks = build_burst(count)
+
+	report("before",*replay(chunks,1,False))
+	report("after",*replay(chunks,100,True))
@@ -0,0 +1,89 @@
+#
+#  QIRC hostmask cache benchmark
+#
+#  Replays channel traffic in which PRIVMSG, JOIN, PART, QUIT, NICK
+#  and INVITE lines come from a few thousand users, the busiest far
+#  more often than the rest, through parse_message(), keeping every
+#  parsed Message alive the way queued signals and batches do.
+#
+#  "before" splits every prefix afresh, like QIRC did before the
+#  cache; "after" uses the cached, interned parse_hostmask(). The
+#  report shows parse rate, then (from a second pass, under
+#  tracemalloc) memory held by the parsed messages and allocations
+#  still live per line, and the cache's hit rate.
+#
+#  Usage: python benchmark/hostmask_cache.py [LINES] [USERS]
+#
+
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import qirc_core
+
+def build_traffic(count,users):
+	random.seed(0)
+	prefixes = [f"user{i}!~ident{i%97}@host-{i}.isp{i%13}.example.com" for i in range(users)]
+	weights = [1/(i+1) for i in range(users)]
+	lines = []
+	for prefix in random.choices(prefixes,weights,k=count):
+		m = random.random()
+		if m<0.85:
+			lines.append(f":{prefix} PRIVMSG #qirc :just chatting away here")
+		elif m<0.9:
+			lines.append(f":{prefix} JOIN :#qirc")
+		elif m<0.95:
+			lines.append(f":{prefix} PART #qirc :bye")
+		elif m<0.97:
+			lines.append(f":{prefix} QUIT :Quit: leaving")
+		elif m<0.99:
+			lines.append(f":{prefix} NICK :{prefix.split('!')[0]}_")
+		else:
+			lines.append(f":{prefix} INVITE qirc :#qirc")
+	return lines
+
+def uncached(mask):
+	return qirc_core.Hostmask(*qirc_core.split_hostmask(mask))
+
+def run(lines,parser):
+	qirc_core.parse_hostmask = parser
+	parse = qirc_core.parse_message
+
+	start = time.perf_counter()
+	messages = [parse(line) for line in lines]
+	elapsed = time.perf_counter() - start
+	messages = None
+
+	# Again, counting allocations this time
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	messages = [parse(line) for line in lines]
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+
+	stats = after.compare_to(before,"filename")
+	size = sum(stat.size_diff for stat in stats)
+	blocks = sum(stat.count_diff for stat in stats)
+	return elapsed, size, blocks
+
+def report(name,count,elapsed,size,blocks):
+	print(f"{name:>8}: {count/elapsed:>9.0f} lines/s, {size/1024/1024:>6.1f} MB held, {blocks/count:>5.1f} allocations/line")
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 200000
+	users = int(sys.argv[2]) if len(sys.argv)>2 else 3000
+
+	lines = build_traffic(count,users)
+	print(f"{count} lines from {users} users")
+
+	cached = qirc_core.parse_hostmask
+	report("before",count,*run(lines,uncached))
+	cached.cache_clear()
+	report("after",count,*run(lines,cached))
+	info = cached.cache_info()
+	print(f"Cache: {info.hits/(info.hits+info.misses)*100:.1f}% hits, {info.currsize} of {info.maxsize} entries")
@@ -0,0 +1,137 @@
+#
+#  QIRC import time and per-connection memory benchmark
+#
+#  Compares the Qt-free core (qirc_core.IRCClient) with the Qt
+#  adapter (qirc.QIRC):
+#
+#  - import time, each module imported in a fresh interpreter, best
+#    of several runs, with the bare interpreter start-up subtracted
+#  - memory per connection, with COUNT clients connected over
+#    loopback to a server that accepts and then stays silent; the
+#    core runs them all on one event loop, QIRC runs a thread (and
+#    an event loop) per client
+#
+#  Memory is reported as the growth of the Python heap (tracemalloc)
+#  and of the resident set size, which also counts thread stacks and
+#  anything Qt allocates.
+#
+#  Usage: python benchmark/import_cost.py [COUNT]
+#
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import threading
+import subprocess
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+RUNS = 5
+
+def import_time(statement):
+	best = None
+	for i in range(RUNS):
+		start = time.perf_counter()
+		subprocess.run([sys.executable,"-c",statement],cwd=ROOT,check=True)
+		elapsed = time.perf_counter() - start
+		if best==None or elapsed<best: best = elapsed
+	return best
+
+def rss():
+	# Resident set size in bytes, where /proc is available
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		return 0
+
+def silent_server():
+	server = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+	server.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+	server.bind(("127.0.0.1",0))
+	server.listen(1024)
+	accepted = []
+	def accept():
+		while True:
+			try:
+				connection, address = server.accept()
+			except OSError:
+				break
+			accepted.append(connection)
+	threading.Thread(target=accept,daemon=True).start()
+	return server, accepted
+
+def wait_for(accepted,count):
+	deadline = time.monotonic() + 30
+	while len(accepted)<count and time.monotonic()<deadline:
+		time.sleep(0.01)
+
+def measure(start_clients,count):
+	server, accepted = silent_server()
+	port = server.getsockname()[1]
+
+	tracemalloc.start()
+	heap = tracemalloc.get_traced_memory()[0]
+	resident = rss()
+
+	stop = start_clients(port,count)
+	wait_for(accepted,count)
+	time.sleep(0.2)
+
+	heap = tracemalloc.get_traced_memory()[0] - heap
+	resident = rss() - resident
+	tracemalloc.stop()
+
+	stop()
+	server.close()
+	for connection in accepted: connection.close()
+	return heap/count, resident/count
+
+def start_core(port,count):
+	from qirc_core import IRCClient
+
+	clients = [IRCClient(server="127.0.0.1",port=port) for i in range(count)]
+	loop = asyncio.new_event_loop()
+	def run():
+		asyncio.set_event_loop(loop)
+		loop.run_until_complete(asyncio.gather(*[c.connect_and_run() for c in clients]))
+	thread = threading.Thread(target=run,daemon=True)
+	thread.start()
+
+	def stop():
+		for client in clients: client.stop()
+		thread.join(10)
+	return stop
+
+def start_qt(port,count):
+	from qirc import QIRC
+
+	clients = [QIRC(server="127.0.0.1",port=port) for i in range(count)]
+	for client in clients: client.start()
+
+	def stop():
+		for client in clients: client.stop()
+	return stop
+
+def report(name,seconds,heap,resident):
+	print(f"{name:>10}: import {seconds*1000:>7.1f} ms, {heap/1024:>7.1f} KB heap/connection, {resident/1024:>7.1f} KB RSS/connection")
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 200
+
+	baseline = import_time("pass")
+	print(f"Interpreter start-up {baseline*1000:.1f} ms, {count} connections each")
+
+	report("qirc_core",import_time("import qirc_core")-baseline,*measure(start_core,count))
+
+	try:
+		import PyQt5.QtCore
+	except ImportError:
+		print("      qirc: PyQt5 is not installed, skipped")
+	else:
+		report("qirc",import_time("import qirc")-baseline,*measure(start_qt,count))
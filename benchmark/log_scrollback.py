@@ -0,0 +1,82 @@
+#
+#  QIRC chat log benchmark
+#
+#  Writes RECORDS channel messages, one a second of log time, to a
+#  ChatLog in a temporary directory, then reads scrollback two ways:
+#
+#  - "scan": read the whole log file and keep the matching lines, the
+#    way a plain text log has to be searched
+#  - "index": ChatLog.scrollback(), which bisects the time index and
+#    maps in just the records asked for
+#
+#  for the last 100 lines and for an hour in the middle of the log,
+#  reporting time per read and how much the process's resident memory
+#  grew.
+#
+#  Usage: python benchmark/log_scrollback.py [RECORDS]
+#
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_log import ChatLog, parse_record
+
+NETWORK = "BenchNet"
+CHANNEL = "#qirc"
+START = 1600000000
+
+def rss():
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		return 0
+
+def scan(log,start=None,end=None,limit=None):
+	# Read every record and filter, no index
+	path = log._path(NETWORK,CHANNEL) + ".log"
+	with open(path,"rb") as f:
+		lines = f.read().decode("utf-8","replace").split("\n")
+	records = [parse_record(CHANNEL,line) for line in lines if line]
+	records = [record for record in records if (start==None or record.time>=start) and (end==None or record.time<end)]
+	return records[-limit:] if limit!=None else records
+
+def measure(read,log,repeat,**query):
+	resident = rss()
+	start = time.perf_counter()
+	for i in range(repeat):
+		records = read(log,**query)
+	elapsed = (time.perf_counter() - start) / repeat
+	return elapsed, len(records), rss() - resident
+
+def report(name,elapsed,count,resident):
+	print(f"{name:>16}: {elapsed*1000:>9.3f} ms, {count:>5} records, {resident/1024/1024:>6.1f} MB RSS growth")
+
+if __name__ == '__main__':
+
+	records = int(sys.argv[1]) if len(sys.argv)>1 else 1000000
+
+	directory = tempfile.mkdtemp()
+	try:
+		log = ChatLog(directory)
+		start = time.perf_counter()
+		for i in range(records):
+			log.write(NETWORK,CHANNEL,"PRIVMSG",f"user{i%500}",f"ident@host{i%500}.example.com",f"message number {i} in the log",START+i)
+		log.flush()
+		elapsed = time.perf_counter() - start
+		size = os.path.getsize(log._path(NETWORK,CHANNEL)+".log")
+		print(f"Wrote {records} records ({size/1024/1024:.1f} MB) in {elapsed:.2f}s, {records/elapsed:.0f} records/s")
+
+		middle = START + records // 2
+		report("scan last 100",*measure(scan,log,3,limit=100))
+		report("index last 100",*measure(ChatLog.scrollback,log,1000,network=NETWORK,channel=CHANNEL,limit=100))
+		report("scan hour",*measure(scan,log,3,start=middle,end=middle+3600))
+		report("index hour",*measure(ChatLog.scrollback,log,100,network=NETWORK,channel=CHANNEL,start=middle,end=middle+3600))
+		log.close()
+	finally:
+		shutil.rmtree(directory)
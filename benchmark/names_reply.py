@@ -0,0 +1,83 @@
+#
+#  QIRC NAMES benchmark
+#
+#  Feeds a synthetic NAMES reply for a very large channel (353 lines
+#  of about 400 bytes, as servers send them, then 366) through QIRC
+#  and reports how long collecting the user list takes, compared
+#  with the list concatenation and de-duplication QIRC 0.0140 did
+#  for every 353 line.
+#
+#  Usage: python benchmark/names_reply.py [MEMBERS]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+
+CHANNEL = "#big"
+
+def build_names(count):
+	lines = []
+	entries = []
+	size = 0
+	for i in range(count):
+		prefix = "@" if i%100==0 else "+" if i%10==0 else ""
+		entry = f"{prefix}user{i}!ident{i}@Clk-{i:08X}.example.com"
+		entries.append(entry)
+		size = size + len(entry) + 1
+		if size>400:
+			lines.append(f":irc.example.net 353 qirc = {CHANNEL} :{' '.join(entries)}")
+			entries = []
+			size = 0
+	if entries:
+		lines.append(f":irc.example.net 353 qirc = {CHANNEL} :{' '.join(entries)}")
+	lines.append(f":irc.example.net 366 qirc {CHANNEL} :End of /NAMES list.")
+	return lines
+
+def legacy_names(lines):
+	# The 353 handling from QIRC 0.0140
+	users = {}
+	for line in lines[:-1]:
+		data = line.split("=")
+		parsed = data[1].split(':')
+		channel = parsed[0].strip()
+		names = parsed[1].split()
+		if channel in users:
+			users[channel] = users[channel] + names
+			users[channel] = list(set(users[channel]))
+		else:
+			users[channel] = names
+	return users[CHANNEL]
+
+def qirc_names(lines,stream):
+	client = IRCClient(server="localhost",port=6667,nickname="qirc",stream_names=stream)
+	client._tracker.join(CHANNEL,"qirc")
+	result = []
+	chunks = []
+	client.on("user_list",lambda data: result.append(data["users"]))
+	client.on("user_list_chunk",lambda data: chunks.append(len(data["users"])))
+	for line in lines:
+		client._dispatch(line)
+	return result[0], chunks
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 50000
+	lines = build_names(count)
+	print(f"NAMES reply for {count} members in {len(lines)-1} lines")
+
+	start = time.perf_counter()
+	users = legacy_names(lines)
+	print(f"  before: {time.perf_counter()-start:.3f}s, {len(users)} users")
+
+	start = time.perf_counter()
+	users, chunks = qirc_names(lines,False)
+	print(f"   after: {time.perf_counter()-start:.3f}s, {len(users)} users, order kept: {users[0]==lines[0].split(':')[2].split()[0]}")
+
+	start = time.perf_counter()
+	users, chunks = qirc_names(lines,True)
+	print(f"  stream: {time.perf_counter()-start:.3f}s, {len(users)} users in {len(chunks)} user_list_chunk signals")
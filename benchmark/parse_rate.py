@@ -0,0 +1,47 @@
+#
+#  QIRC message parser benchmark
+#
+#  Parses a corpus of server traffic with parse_message() and reports
+#  lines and megabytes parsed per second. By default the corpus is
+#  benchmark/traffic.txt (registration, MOTD, NAMES, chat, WHOIS,
+#  errors and IRCv3 tagged lines); pass the path of a capture of real
+#  server traffic, one line per message, to use that instead.
+#
+#  Usage: python benchmark/parse_rate.py [CORPUS] [REPEAT]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import parse_message
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic.txt")
+
+def load_corpus(path):
+	with open(path,"rb") as f:
+		data = f.read()
+	lines = []
+	for line in data.split(b"\n"):
+		line = line.rstrip(b"\r")
+		if line: lines.append(line.decode("utf-8","replace"))
+	return lines
+
+if __name__ == '__main__':
+
+	path = sys.argv[1] if len(sys.argv)>1 else CORPUS
+	repeat = int(sys.argv[2]) if len(sys.argv)>2 else 2000
+
+	lines = load_corpus(path)
+	size = sum(len(line.encode("utf-8"))+2 for line in lines)
+
+	start = time.perf_counter()
+	for i in range(repeat):
+		for line in lines:
+			parse_message(line)
+	elapsed = time.perf_counter() - start
+
+	count = len(lines) * repeat
+	print(f"{count} lines in {elapsed:.3f}s: {count/elapsed:.0f} lines/s, {size*repeat/elapsed/1024/1024:.1f} MB/s")
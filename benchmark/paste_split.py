@@ -0,0 +1,103 @@
+#
+#  QIRC paste splitting benchmark
+#
+#  Splits a large multi-line paste (ASCII, accented and CJK text and
+#  emoji, with some long unbroken runs) into PRIVMSG lines with
+#  IRCClient.privmsg(), which queues them, and checks every line fits
+#  in 512 bytes with no text lost. The awkward cases for split_text()
+#  and format_message() are checked by check_splitting.py.
+#
+#  "naive" is the obvious splitter: add one word at a time, encoding
+#  the growing line to see if it still fits, and split words that are
+#  too long a character at a time.
+#
+#  Usage: python benchmark/paste_split.py [KILOBYTES] [ENCODING]
+#
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+
+WORDS = ["the", "quick", "brown", "fox", "jumps", "över", "lazy", "dög", "日本語", "テキスト", "😀", "ĉu", "naïve", "café"]
+
+def build_paste(kilobytes):
+	random.seed(0)
+	lines = []
+	size = 0
+	while size<kilobytes*1024:
+		if random.random()<0.05:
+			line = "".join(random.choice(WORDS) for i in range(random.randint(50,400)))
+		else:
+			line = " ".join(random.choice(WORDS) for i in range(random.randint(1,300)))
+		lines.append(line)
+		size = size + len(line.encode("utf-8")) + 1
+	return "\n".join(lines)
+
+def naive_split(text,limit,encoding):
+	pieces = []
+	for line in text.split("\n"):
+		current = ""
+		for word in line.split(" "):
+			candidate = word if not current else current + " " + word
+			if len(candidate.encode(encoding))<=limit:
+				current = candidate
+				continue
+			if current: pieces.append(current)
+			current = ""
+			for character in word:
+				if len((current+character).encode(encoding))>limit:
+					pieces.append(current)
+					current = ""
+				current = current + character
+		if current: pieces.append(current)
+	return pieces
+
+def naive_privmsg(client,target,text):
+	start = "PRIVMSG " + target + " :"
+	budget = 510 - len(client._prefix_estimate().encode(client.encoding)) - len(start.encode(client.encoding))
+	for piece in naive_split(text,budget,client.encoding):
+		client._qsend(start + piece,target)
+
+def new_client(encoding):
+	client = IRCClient(server="localhost",port=6667,nickname="qirc",encoding=encoding,queue_limit=0,queue_target_limit=0)
+	client.userhost = "qirc@host.example.com"
+	return client
+
+def check(client,text):
+	lines = client.pending()
+	prefix = client._prefix_estimate()
+	longest = max(len((prefix + line).encode(client.encoding)) for line in lines)
+	start = len("PRIVMSG #qirc :")
+	sent = "".join(line[start:] for line in lines).replace(" ","")
+	return len(lines), longest, sent==text.replace(" ","").replace("\n","")
+
+def run(send,text,encoding):
+	client = new_client(encoding)
+	start = time.perf_counter()
+	send(client,"#qirc",text)
+	elapsed = time.perf_counter() - start
+	return elapsed, *check(client,text)
+
+def report(name,size,elapsed,lines,longest,complete):
+	print(f"{name:>8}: {elapsed:.3f}s, {size/elapsed/1024/1024:>6.2f} MB/s, {lines:>6} lines, longest {longest} bytes, text complete: {complete}")
+
+if __name__ == '__main__':
+
+	kilobytes = int(sys.argv[1]) if len(sys.argv)>1 else 1024
+	encoding = sys.argv[2] if len(sys.argv)>2 else "utf-8"
+
+	text = build_paste(kilobytes)
+	size = len(text.encode(encoding))
+	print(f"Splitting a {size/1024:.0f} KB paste of {text.count(chr(10))+1} lines, {encoding}")
+
+	report("naive",size,*run(naive_privmsg,text,encoding))
+	results = run(IRCClient.privmsg,text,encoding)
+	report("privmsg",size,*results)
+	elapsed, lines, longest, complete = results
+	if longest>510 or not complete:
+		sys.exit(1)
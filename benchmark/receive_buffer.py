@@ -0,0 +1,114 @@
+#
+#  QIRC receive buffer benchmark
+#
+#  Replays several megabytes of server traffic through a fake socket
+#  and compares the old receive path (decode each chunk, append to a
+#  str buffer, slice off every line) with QIRC's bytes-level buffer
+#  (recv_into a preallocated buffer, frame on newlines as bytes,
+#  decode one line at a time).
+#
+#  The traffic contains multibyte UTF-8 text, so the report also
+#  counts lines the old path mangled by decoding a chunk that ended
+#  in the middle of a character.
+#
+#  Usage: python benchmark/receive_buffer.py [MEGABYTES] [READ_SIZE]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+
+class NullTransport:
+
+	def write(self,data):
+		pass
+
+class ReplaySocket:
+
+	def __init__(self,data):
+		self.data = memoryview(data)
+		self.position = 0
+
+	def recv(self,size):
+		chunk = self.data[self.position:self.position+size]
+		self.position = self.position + len(chunk)
+		return bytes(chunk)
+
+	def recv_into(self,buffer,size):
+		chunk = self.data[self.position:self.position+size]
+		buffer[:len(chunk)] = chunk
+		self.position = self.position + len(chunk)
+		return len(chunk)
+
+def build_replay(megabytes):
+	lines = []
+	size = 0
+	i = 0
+	while size<megabytes*1024*1024:
+		line = f":user{i%500}!ident@host.example.com PRIVMSG #qirc :ünïcödé message {i} – ☕ ok\r\n".encode("utf-8")
+		lines.append(line)
+		size = size + len(line)
+		i = i + 1
+	return b"".join(lines), i
+
+def collect(client):
+	messages = []
+	client._dispatch = messages.append
+	return messages
+
+def legacy_receive(client,sock,read_size):
+	# The receive loop from QIRC 0.0140
+	buffer = ""
+	while True:
+		data = sock.recv(read_size)
+		if not data: break
+		try:
+			buffer = buffer + data.decode(client.encoding)
+		except UnicodeDecodeError:
+			buffer = buffer + data.decode('iso-8859-1')
+		while True:
+			newline = buffer.find("\n")
+			if newline == -1: break
+			line = buffer[:newline]
+			buffer = buffer[newline+1:]
+			client._dispatch(line.rstrip("\r"))
+
+def bytes_receive(client,sock,read_size):
+	# The receive step from IRCClient._data_received()
+	view = memoryview(bytearray(read_size))
+	while True:
+		count = sock.recv_into(view,read_size)
+		if count==0: break
+		client._buffer += view[:count]
+		while client._process_buffer(client.max_lines_per_read): pass
+
+def run(receive,data,read_size):
+	client = IRCClient(server="localhost",port=6667,read_size=read_size)
+	client._transport = NullTransport()
+	messages = collect(client)
+	sock = ReplaySocket(data)
+
+	start = time.perf_counter()
+	receive(client,sock,read_size)
+	elapsed = time.perf_counter() - start
+
+	mangled = sum(1 for line in messages if "ünïcödé" not in line)
+	return len(messages), mangled, elapsed
+
+def report(name,size,lines,mangled,elapsed):
+	print(f"{name:>8}: {lines:>8} lines, {size/elapsed/1024/1024:>7.1f} MB/s, {lines/elapsed:>10.0f} lines/s, {mangled} mangled lines")
+
+if __name__ == '__main__':
+
+	megabytes = float(sys.argv[1]) if len(sys.argv)>1 else 8
+	read_size = int(sys.argv[2]) if len(sys.argv)>2 else 4096
+
+	data, count = build_replay(megabytes)
+	print(f"Replaying {len(data)/1024/1024:.1f} MB ({count} lines) in {read_size} byte reads")
+
+	report("before",len(data),*run(legacy_receive,data,read_size))
+	report("after",len(data),*run(bytes_receive,data,read_size))
@@ -0,0 +1,94 @@
+#
+#  QIRC replay throughput benchmark
+#
+#  Replays a recording made with the record setting through
+#  IRCClient's parsing and dispatch as fast as it will go, ROUNDS
+#  times, and reports the best and median throughput, so runs on the
+#  same recording can be compared from one change to the next.
+#
+#  With no recording given, one is made up: a busy channel's NAMES
+#  and chat, in 4 KB reads like a real connection's, with joins,
+#  parts, quits, nick changes and PINGs mixed in. The cost of
+#  recording is shown too, as the time to replay with a recorder on.
+#
+#  Usage: python benchmark/replay_throughput.py [RECORDING] [ROUNDS]
+#
+
+import os
+import sys
+import random
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+from qirc_record import Recorder, replay
+
+def make_recording(path,lines):
+	random.seed(0)
+	traffic = [":stand.in 001 qirc :Welcome", ":qirc!qirc@client.example.com JOIN #qirc"]
+	names = [f"user{i}" for i in range(1000)]
+	for i in range(0,len(names),20):
+		traffic.append(":stand.in 353 qirc = #qirc :" + " ".join(names[i:i+20]))
+	traffic.append(":stand.in 366 qirc #qirc :End of /NAMES list.")
+	for i in range(lines):
+		nick = random.choice(names)
+		mask = f"{nick}!~{nick}@{nick}.example.com"
+		m = random.random()
+		if m<0.9:
+			traffic.append(f"@time=2020-01-01T00:00:{i%60:02d}.000Z :{mask} PRIVMSG #qirc :message {i} with some ordinary chat in it")
+		elif m<0.93:
+			traffic.append(f":{mask} PART #qirc :bye")
+			traffic.append(f":{mask} JOIN #qirc")
+		elif m<0.96:
+			traffic.append(f":{mask} QUIT :Quit: leaving")
+			traffic.append(f":{mask} JOIN #qirc")
+		elif m<0.99:
+			traffic.append(f":{mask} NICK {nick}_")
+			traffic.append(f":{nick}_!~{nick}@{nick}.example.com NICK {nick}")
+		else:
+			traffic.append(f"PING :{i}")
+	data = "".join(line + "\r\n" for line in traffic).encode()
+
+	recorder = Recorder(path)
+	recorder.connected()
+	for i in range(0,len(data),4096):
+		recorder.received(data[i:i+4096])
+	recorder.disconnected()
+	recorder.close()
+
+def run(path,record=None):
+	client = IRCClient(server="replay",nickname="qirc",flood_protection=False)
+	if record!=None: client.configure(record=record)
+	lines = [0]
+	def count(data):
+		lines[0] = lines[0] + 1
+	for event in ("message_public", "user_join", "user_part", "user_quit", "user_nick", "server_ping"):
+		client.on(event,count)
+	chunks, received, elapsed = asyncio.run(replay(client,path))
+	if client.recorder!=None: client.recorder.close()
+	return received, lines[0], elapsed
+
+if __name__ == '__main__':
+
+	path = sys.argv[1] if len(sys.argv)>1 else None
+	rounds = int(sys.argv[2]) if len(sys.argv)>2 else 5
+
+	directory = tempfile.mkdtemp()
+	if path==None:
+		path = os.path.join(directory,"made-up.qrec")
+		make_recording(path,200000)
+
+	results = sorted(run(path) for i in range(rounds))
+	received, events, best = results[0][0], results[0][1], min(result[2] for result in results)
+	median = sorted(result[2] for result in results)[len(results)//2]
+	print(f"{os.path.basename(path)}: {received/1024/1024:.1f} MB, {events} events")
+	print(f"   replay: best {received/best/1024/1024:>6.2f} MB/s, median {received/median/1024/1024:>6.2f} MB/s, {events/median:>8.0f} events/s")
+
+	recording = os.path.join(directory,"again.qrec")
+	received, events, elapsed = run(path,recording)
+	print(f"recording: {received/elapsed/1024/1024:>6.2f} MB/s while recording again")
+	os.remove(recording)
+	if path.startswith(directory): os.remove(path)
+	os.rmdir(directory)
@@ -0,0 +1,118 @@
+#
+#  QIRC chat search benchmark
+#
+#  Feeds MESSAGES chat messages across 20 channels, one a second of
+#  chat time, to both a ChatLog and a SearchIndex, while another
+#  thread searches the index the whole time, so searches race the
+#  background segment writes and merges. Then runs the same queries
+#  two ways:
+#
+#  - "grep": read every channel's log and match each line, the way
+#    searching plain logs works
+#  - "index": SearchIndex.search()
+#
+#  The report shows indexing rate, the slowest search seen while
+#  indexing, and time per query.
+#
+#  Usage: python benchmark/search_index.py [MESSAGES]
+#
+
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_log import ChatLog
+from qirc_search import SearchIndex
+
+NETWORK = "BenchNet"
+START = 1600000000
+WORDS = ["the", "a", "is", "release", "build", "qirc", "python", "server", "error", "works", "thanks", "anyone", "know", "how", "socket", "patch", "merge", "review", "tonight", "weekend"]
+
+def build_messages(count):
+	random.seed(0)
+	for i in range(count):
+		words = random.choices(WORDS,k=random.randint(3,12))
+		if random.random()<0.001: words.append("kumquat")
+		yield f"#channel{i%20}", f"user{random.randrange(300)}", " ".join(words), START + i
+
+def grep(directory,words,channel=None,nickname=None,start=None,end=None,limit=50):
+	# Scans every log, newest match first
+	log = ChatLog(directory)
+	patterns = [re.compile(r"\b" + word + r"\b",re.IGNORECASE) for word in words]
+	matches = []
+	for name in log.channels(NETWORK):
+		if channel!=None and name!=channel: continue
+		for record in log.scrollback(NETWORK,name):
+			if record.kind!="PRIVMSG": continue
+			if nickname!=None and record.nickname!=nickname: continue
+			if start!=None and record.time<start: continue
+			if end!=None and record.time>=end: continue
+			if all(pattern.search(record.text) for pattern in patterns):
+				matches.append(record)
+	log.close()
+	matches.sort(key=lambda record: record.time,reverse=True)
+	return matches[:limit]
+
+def timed(function,repeat):
+	start = time.perf_counter()
+	for i in range(repeat):
+		results = function()
+	return (time.perf_counter() - start) / repeat, len(results)
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 500000
+
+	directory = tempfile.mkdtemp()
+	try:
+		log = ChatLog(os.path.join(directory,"log"))
+		index = SearchIndex(os.path.join(directory,"search"))
+
+		# Search continuously while indexing
+		slowest = [0, 0]
+		indexing = threading.Event()
+		indexing.set()
+		def searcher():
+			while indexing.is_set():
+				start = time.perf_counter()
+				index.search("release patch",limit=20)
+				slowest[0] = max(slowest[0],time.perf_counter()-start)
+				slowest[1] = slowest[1] + 1
+		thread = threading.Thread(target=searcher)
+		thread.start()
+
+		start = time.perf_counter()
+		for channel, nickname, text, when in build_messages(count):
+			log.write(NETWORK,channel,"PRIVMSG",nickname,"ident@example.com",text,when)
+			index.add(NETWORK,channel,nickname,text,when)
+		elapsed = time.perf_counter() - start
+		indexing.clear()
+		thread.join()
+		log.close()
+		index.close()
+
+		print(f"Logged and indexed {count} messages in {elapsed:.2f}s, {count/elapsed:.0f} messages/s")
+		print(f"{slowest[1]} searches while indexing, slowest {slowest[0]*1000:.1f} ms; segments now {index.segments()}")
+
+		middle = START + count // 2
+		queries = [
+			("rare word", dict(words=["kumquat"])),
+			("two words", dict(words=["socket","error"])),
+			("word, nick", dict(words=["patch"],nickname="user42")),
+			("word, channel, hour", dict(words=["review"],channel="#channel3",start=middle,end=middle+3600)),
+		]
+		logs = os.path.join(directory,"log")
+		for name, query in queries:
+			words = query.pop("words")
+			grep_time, grep_found = timed(lambda: grep(logs,words,**query),1)
+			index_time, index_found = timed(lambda: index.search(" ".join(words),network=NETWORK,**query),20)
+			print(f"{name:>20}: grep {grep_time*1000:>8.1f} ms, index {index_time*1000:>7.2f} ms, {index_found} results{'' if grep_found==index_found else ' (grep found '+str(grep_found)+')'}")
+	finally:
+		shutil.rmtree(directory)
@@ -0,0 +1,194 @@
+#
+#  QIRC benchmark stand-in server
+#
+#  A local IRC server for benchmarks, on its own thread. It registers
+#  clients like a real server would (CAP negotiation is ignored, so
+#  clients fall back to PROTOCTL), answers PING, JOIN, WHOIS and
+#  QUIT, and takes BENCH commands from the client to generate load:
+#
+#    BENCH PRIVMSG count channel   count PRIVMSGs to channel
+#    BENCH NAMES count channel     a NAMES reply for count users
+#    BENCH NETSPLIT count channel  count of those users QUIT in a
+#                                  netsplit
+#    BENCH MOTD count              a count line MOTD
+#    BENCH LATENCY count           once count PRIVMSGs have arrived
+#                                  from the client, a PRIVMSG back
+#                                  with their latency percentiles
+#
+#  PRIVMSGs in a flood start with the time.perf_counter() they were
+#  written to the socket at; PRIVMSGs from a client are expected to
+#  start with the time they were sent at, for BENCH LATENCY. Both
+#  ends must share a clock, so the server is either run in the same
+#  process or, as the runner does, on the same machine with
+#
+#    python -m benchmark.server
+#
+#  which prints the port it's listening on.
+#
+
+import sys
+import time
+import asyncio
+import threading
+
+HOSTNAME = "stand.in"
+CHUNK_SIZE = 65536
+
+class StandInServer:
+
+	def __init__(self,host="127.0.0.1",port=0,on_register=None):
+		# on_register(session) is called on the server's thread when a
+		# client registers
+		self.host = host
+		self.port = port
+		self.on_register = on_register
+		self.sessions = []
+		self.loop = asyncio.new_event_loop()
+		self.ready = threading.Event()
+		self.thread = threading.Thread(target=self._run,daemon=True)
+		self.thread.start()
+		self.ready.wait()
+
+	def _run(self):
+		asyncio.set_event_loop(self.loop)
+		server = self.loop.run_until_complete(asyncio.start_server(self._client,self.host,self.port,backlog=1024))
+		self.port = server.sockets[0].getsockname()[1]
+		self.ready.set()
+		self.loop.run_forever()
+
+	async def _client(self,reader,writer):
+		session = Session(self,writer)
+		self.sessions.append(session)
+		try:
+			while True:
+				line = await reader.readline()
+				if not line: break
+				await session.handle(line.decode("utf-8","replace").rstrip("\r\n"))
+		except ConnectionError:
+			pass
+		self.sessions.remove(session)
+		writer.close()
+
+	def stop(self):
+		self.loop.call_soon_threadsafe(self.loop.stop)
+
+class Session:
+
+	# One client's connection
+
+	def __init__(self,server,writer):
+		self.server = server
+		self.writer = writer
+		self.nickname = "*"
+		self.registered = False
+		self.latencies = []
+		self._latency_wanted = 0
+
+	def send(self,line):
+		self.writer.write((line + "\r\n").encode("utf-8"))
+
+	async def send_lines(self,lines):
+		# Writes lines in chunks, waiting for each to drain
+		chunk = []
+		size = 0
+		for line in lines:
+			chunk.append(line + "\r\n")
+			size = size + len(line) + 2
+			if size>=CHUNK_SIZE:
+				self.writer.write("".join(chunk).encode("utf-8"))
+				await self.writer.drain()
+				chunk = []
+				size = 0
+		if chunk:
+			self.writer.write("".join(chunk).encode("utf-8"))
+			await self.writer.drain()
+
+	async def handle(self,line):
+		words = line.split(" ")
+		command = words[0].upper()
+
+		if command=="NICK" and len(words)>1:
+			self.nickname = words[1].lstrip(":")
+		elif command=="USER" and not self.registered:
+			self.registered = True
+			self.send(f":{HOSTNAME} 001 {self.nickname} :Welcome to the stand-in network {self.nickname}")
+			self.send(f":{HOSTNAME} 004 {self.nickname} {HOSTNAME} stand-in-1 io ov")
+			self.send(f":{HOSTNAME} 005 {self.nickname} NETWORK=StandIn CASEMAPPING=ascii PREFIX=(ov)@+ CHANTYPES=# :are supported by this server")
+			self.send(f":{HOSTNAME} 422 {self.nickname} :MOTD File is missing")
+			if self.server.on_register!=None: self.server.on_register(self)
+		elif command=="PING":
+			self.send(f":{HOSTNAME} PONG {HOSTNAME} :{line.split(' ',1)[1].lstrip(':') if len(words)>1 else ''}")
+		elif command=="JOIN" and len(words)>1:
+			for channel in words[1].lstrip(":").split(","):
+				self.send(f":{self.nickname}!bench@client.example.com JOIN {channel}")
+				self.send(f":{HOSTNAME} 353 {self.nickname} = {channel} :@{self.nickname}")
+				self.send(f":{HOSTNAME} 366 {self.nickname} {channel} :End of /NAMES list.")
+		elif command=="WHOIS" and len(words)>1:
+			nickname = words[-1]
+			self.send(f":{HOSTNAME} 311 {self.nickname} {nickname} ~{nickname} {nickname}.example.com * :{nickname}")
+			self.send(f":{HOSTNAME} 312 {self.nickname} {nickname} {HOSTNAME} :Stand-in server")
+			self.send(f":{HOSTNAME} 318 {self.nickname} {nickname} :End of /WHOIS list.")
+		elif command=="PRIVMSG" and len(words)>2:
+			stamp = words[2].lstrip(":")
+			try:
+				self.latencies.append(time.perf_counter() - float(stamp))
+			except ValueError:
+				pass
+			self._check_latency()
+		elif command=="QUIT":
+			self.writer.close()
+		elif command=="BENCH" and len(words)>1:
+			await self.bench(words[1].upper(),words[2:])
+
+	async def bench(self,load,arguments):
+		count = int(arguments[0]) if arguments else 0
+		channel = arguments[1] if len(arguments)>1 else "#bench"
+
+		if load=="PRIVMSG":
+			await self.flood(count,channel)
+		elif load=="NAMES":
+			names = [f"{'@' if i%100==0 else ''}user{i}!~user{i}@host{i}.example.com" for i in range(count)]
+			lines = (f":{HOSTNAME} 353 {self.nickname} = {channel} :{' '.join(names[i:i+8])}" for i in range(0,count,8))
+			await self.send_lines(lines)
+			self.send(f":{HOSTNAME} 366 {self.nickname} {channel} :End of /NAMES list.")
+		elif load=="NETSPLIT":
+			await self.send_lines(f":user{i}!~user{i}@host{i}.example.com QUIT :*.net *.split" for i in range(count))
+		elif load=="MOTD":
+			self.send(f":{HOSTNAME} 375 {self.nickname} :- {HOSTNAME} Message of the day -")
+			await self.send_lines(f":{HOSTNAME} 372 {self.nickname} :- Line {i} of the stand-in server's rather long message of the day" for i in range(count))
+			self.send(f":{HOSTNAME} 376 {self.nickname} :End of /MOTD command.")
+		elif load=="LATENCY":
+			self._latency_wanted = count
+			self._check_latency()
+
+	async def flood(self,count,channel):
+		# Stamped as each chunk is written
+		sent = 0
+		while sent<count:
+			stamp = time.perf_counter()
+			lines = min(count-sent,CHUNK_SIZE//80)
+			self.writer.write("".join(f":sender{i%50}!~sender@sender.example.com PRIVMSG {channel} :{stamp:.6f} message {i}\r\n" for i in range(sent,sent+lines)).encode())
+			sent = sent + lines
+			await self.writer.drain()
+
+	def _check_latency(self):
+		if not self._latency_wanted or len(self.latencies)<self._latency_wanted: return
+		samples = sorted(self.latencies)
+		self.latencies = []
+		self._latency_wanted = 0
+		values = " ".join(f"{percentile(samples,p):.6f}" for p in (50, 90, 99, 100))
+		self.send(f":{HOSTNAME} PRIVMSG {self.nickname} :latency {len(samples)} {values}")
+
+def percentile(samples,p):
+	# samples must be sorted
+	if not samples: return 0
+	return samples[min(len(samples)-1,int(len(samples)*p/100))]
+
+if __name__ == '__main__':
+
+	server = StandInServer(port=int(sys.argv[1]) if len(sys.argv)>1 else 0)
+	print(f"port {server.port}",flush=True)
+	try:
+		server.thread.join()
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,96 @@
+#
+#  QIRC signal batching benchmark
+#
+#  Dispatches a PRIVMSG flood on a worker thread and delivers the
+#  events to a slot on the main thread through Qt's event loop, the
+#  way a GUI receives them from QIRC, and reports events delivered
+#  per second, and how many signals that took, with one signal per
+#  event and with message_batch. The flood arrives in small reads,
+#  READ_SIZE bytes each, as it would from a socket, on an asyncio
+#  event loop so batch_interval's timer runs.
+#
+#  Usage: python benchmark/signal_batching.py [EVENTS] [BATCH_SIZE]
+#
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSlot
+
+from qirc import QIRC
+
+READ_SIZE = 512
+
+class Receiver(QObject):
+
+	def __init__(self,total):
+		super(Receiver, self).__init__(None)
+		self.total = total
+		self.events = 0
+		self.signals = 0
+		self.finished = 0
+
+	@pyqtSlot(dict)
+	def gotEvent(self,data):
+		self.events = self.events + 1
+		self.signals = self.signals + 1
+		self.check()
+
+	@pyqtSlot(list)
+	def gotBatch(self,events):
+		self.signals = self.signals + 1
+		for signal, data in events:
+			if signal=="message_public":
+				self.events = self.events + 1
+		self.check()
+
+	def check(self):
+		if self.events>=self.total:
+			self.finished = time.perf_counter()
+			QCoreApplication.quit()
+
+async def feed(client,data):
+	client._loop = asyncio.get_running_loop()
+	client._loop_thread = threading.get_ident()
+	for i in range(0,len(data),READ_SIZE):
+		client._buffer += data[i:i+READ_SIZE]
+		while client._process_buffer(client.max_lines_per_read): pass
+		await asyncio.sleep(0)
+	# Let the last batch's interval run out
+	await asyncio.sleep(client.batch_interval/1000*2)
+
+def run(app,count,batch_size):
+	data = b"".join(f":user{i%500}!ident@host.example.com PRIVMSG #qirc :message {i}\r\n".encode() for i in range(count))
+
+	client = QIRC(server="localhost",port=6667,batch_signals=batch_size>0,batch_size=max(batch_size,1))
+
+	receiver = Receiver(count)
+	if batch_size>0:
+		client.message_batch.connect(receiver.gotBatch)
+	else:
+		client.message_public.connect(receiver.gotEvent)
+
+	feeder = threading.Thread(target=asyncio.run,args=(feed(client,data),))
+	start = time.perf_counter()
+	QTimer.singleShot(0,feeder.start)
+	app.exec_()
+	feeder.join()
+	return receiver.events, receiver.signals, receiver.finished - start
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 100000
+	batch_size = int(sys.argv[2]) if len(sys.argv)>2 else 100
+
+	app = QCoreApplication([])
+
+	events, signals, elapsed = run(app,count,0)
+	print(f" per-event: {events} events in {elapsed:.3f}s, {events/elapsed:.0f} events/s, {signals} signals")
+
+	events, signals, elapsed = run(app,count,batch_size)
+	print(f"   batched: {events} events in {elapsed:.3f}s, {events/elapsed:.0f} events/s, {signals} signals (batch_size={batch_size})")
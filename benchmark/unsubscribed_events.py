@@ -0,0 +1,54 @@
+#
+#  QIRC unsubscribed events benchmark
+#
+#  Replays the made-up busy channel from replay_throughput.py through
+#  a client that only listens for private messages, as a headless bot
+#  might, and compares it with the same client emitting every event
+#  regardless (emit_unsubscribed, as QIRC did before events nobody
+#  listens to were skipped) and with one listening to everything.
+#
+#  Usage: python benchmark/unsubscribed_events.py [LINES] [ROUNDS]
+#
+
+import os
+import sys
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+from qirc_record import replay
+from benchmark.replay_throughput import make_recording
+
+EVENTS = ("message_all", "message_public", "message_private", "message_action", "user_join", "user_part", "user_quit", "user_nick", "user_list", "server_ping")
+
+def run(path,listen,emit_unsubscribed=False):
+	client = IRCClient(server="replay",nickname="qirc",flood_protection=False,emit_unsubscribed=emit_unsubscribed)
+	for event in listen:
+		client.on(event,lambda data: None)
+	chunks, received, elapsed = asyncio.run(replay(client,path))
+	return client.lines_received, elapsed
+
+if __name__ == '__main__':
+
+	lines = int(sys.argv[1]) if len(sys.argv)>1 else 200000
+	rounds = int(sys.argv[2]) if len(sys.argv)>2 else 5
+
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory,"made-up.qrec")
+	make_recording(path,lines)
+
+	for name, listen, emit_unsubscribed in (
+		("private messages only", ["message_private"], False),
+		("emit_unsubscribed", ["message_private"], True),
+		("every event", EVENTS, False),
+	):
+		results = [run(path,listen,emit_unsubscribed) for i in range(rounds)]
+		count = results[0][0]
+		best = min(result[1] for result in results)
+		median = sorted(result[1] for result in results)[len(results)//2]
+		print(f"{name:<24} best {count/best:>9.0f} lines/s, median {count/median:>9.0f} lines/s, {median/count*1000000:>6.2f} us/line")
+
+	os.remove(path)
+	os.rmdir(directory)
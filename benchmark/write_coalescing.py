@@ -0,0 +1,129 @@
+#
+#  QIRC write coalescing benchmark
+#
+#  Two bursts of outgoing lines over a loopback connection:
+#
+#  - "pong": the server sends COUNT PINGs at once and waits for every
+#    PONG
+#  - "send": another thread calls send() COUNT times with flood
+#    protection off and the server waits for every line
+#
+#  "before" writes each line to the transport on its own, like QIRC
+#  0.0140 did with socket.send(); "after" writes every line collected
+#  while handling a read or a pass over the send queue together. The
+#  report shows transport writes, which asyncio turns into one send()
+#  each while the socket keeps up.
+#
+#  Usage: python benchmark/write_coalescing.py [COUNT]
+#
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qirc_core import IRCClient
+
+class SinkServer:
+
+	# Welcomes the client, since it sends nothing else until it's
+	# registered, then sends PINGs when asked and counts the lines it
+	# gets back
+
+	def __init__(self):
+		self.loop = asyncio.new_event_loop()
+		self.ready = threading.Event()
+		self.done = threading.Event()
+		self.expected = 0
+		self.received = 0
+		self.writer = None
+		self.thread = threading.Thread(target=self._run,daemon=True)
+		self.thread.start()
+		self.ready.wait()
+
+	def _run(self):
+		asyncio.set_event_loop(self.loop)
+		server = self.loop.run_until_complete(asyncio.start_server(self._client,"127.0.0.1",0))
+		self.port = server.sockets[0].getsockname()[1]
+		self.ready.set()
+		self.loop.run_forever()
+
+	async def _client(self,reader,writer):
+		self.writer = writer
+		while True:
+			line = await reader.readline()
+			if not line: break
+			if line.startswith(b"USER"):
+				writer.write(b":sink 001 qircclient :Welcome\r\n")
+			if line.startswith(b"PONG") or line.startswith(b"PRIVMSG"):
+				self.received = self.received + 1
+				if self.received==self.expected: self.done.set()
+		writer.close()
+
+	def expect(self,count):
+		self.expected = count
+		self.received = 0
+		self.done.clear()
+
+	def ping(self,count):
+		data = b"".join(b"PING :%d\r\n" % i for i in range(count))
+		self.loop.call_soon_threadsafe(self.writer.write,data)
+
+def legacy_send(client):
+	# One transport write per line, as before
+	def send(data):
+		client._last_message_time = time.monotonic()
+		if client._transport!=None:
+			line = bytes(data + "\r\n", client.encoding)
+			client._transport.write(line)
+			client.bytes_sent = client.bytes_sent + len(line)
+			client.lines_sent = client.lines_sent + 1
+			client.writes = client.writes + 1
+	client._send = send
+
+def run(server,count,legacy):
+	client = IRCClient(server="127.0.0.1",port=server.port,flood_protection=False,queue_limit=0,queue_target_limit=0)
+	if legacy: legacy_send(client)
+	registered = threading.Event()
+	client.on("server_register",lambda data: registered.set())
+	thread = threading.Thread(target=asyncio.run,args=(client.connect_and_run(),),daemon=True)
+	thread.start()
+	if not registered.wait(30): raise RuntimeError("the sink server didn't register the client")
+	time.sleep(0.1)
+
+	results = []
+
+	writes = client.writes
+	server.expect(count)
+	start = time.perf_counter()
+	server.ping(count)
+	server.done.wait(60)
+	results.append(("pong",time.perf_counter()-start,client.writes-writes))
+
+	writes = client.writes
+	server.expect(count)
+	start = time.perf_counter()
+	for i in range(count):
+		client.send(f"PRIVMSG #qirc :line {i}")
+	server.done.wait(60)
+	results.append(("send",time.perf_counter()-start,client.writes-writes))
+
+	client.stop()
+	thread.join(10)
+	server.writer = None
+	return results
+
+def report(name,count,results):
+	for burst, elapsed, writes in results:
+		print(f"{name:>8} {burst}: {count:>7} lines in {elapsed:.3f}s, {count/elapsed:>9.0f} lines/s, {writes:>7} writes")
+
+if __name__ == '__main__':
+
+	count = int(sys.argv[1]) if len(sys.argv)>1 else 20000
+
+	server = SinkServer()
+	report("before",count,run(server,count,True))
+	report("after",count,run(server,count,False))
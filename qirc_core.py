@@ -0,0 +1,2925 @@
+#
+#  QIRC Python Core
+#  Copyright (C) 2019  Daniel Hetrick
+#               _   _       _                         
+#              | | (_)     | |                        
+#   _ __  _   _| |_ _  ___ | |__                      
+#  | '_ \| | | | __| |/ _ \| '_ \                     
+#  | | | | |_| | |_| | (_) | |_) |                    
+#  |_| |_|\__,_|\__| |\___/|_.__/ _                   
+#  | |     | |    _/ |           | |                  
+#  | | __ _| |__ |__/_  _ __ __ _| |_ ___  _ __ _   _ 
+#  | |/ _` | '_ \ / _ \| '__/ _` | __/ _ \| '__| | | |
+#  | | (_| | |_) | (_) | | | (_| | || (_) | |  | |_| |
+#  |_|\__,_|_.__/ \___/|_|  \__,_|\__\___/|_|   \__, |
+#                                                __/ |
+#                                               |___/ 
+#  https://github.com/nutjob-laboratories
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import codecs
+import datetime
+import time
+import sys
+import random
+import threading
+import traceback
+import bisect
+import functools
+import concurrent.futures
+from collections import deque, OrderedDict, namedtuple
+
+SSL_AVAILABLE = True
+try:
+	import ssl
+except ImportError:
+	SSL_AVAILABLE = False
+
+QIRC_VERSION = "0.0140"
+
+# Outgoing message priorities, highest first
+PRIORITY_CONTROL = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+class IRCClient:
+
+	# The IRC protocol engine, without any Qt. It runs on an asyncio
+	# event loop and reports everything through the same events QIRC
+	# has signals for; connect a callback to one with on().
+	#
+	#   client = IRCClient(server="localhost",port=6667,nickname="bot")
+	#   client.on("message_public",print)
+	#   asyncio.run(client.connect_and_run())
+	#
+	# send(), privmsg(), join(), part(), quit() and stop() can be
+	# called from any thread.
+
+	def __init__(self,**kwargs):
+
+		self.server = None
+		self.port = 0
+		self.nickname = "qircclient"
+		self.username = "qircclient"
+		self.realname = "qircclient"
+		self.alternate = "qirc_client"
+		self.password = None
+		self.encoding = "utf-8"
+		self.flood_protection = True
+		self.flood_protection_send_rate = 1.5
+
+		self.ssl = False
+		self._ssl_verify_hostname = False
+		self._ssl_verify_cert = False
+		self._ssl_context = None
+		self.tls_session_reused = False
+
+		self.uptime = 0
+
+		# Callbacks registered with on(), keyed by event name, and
+		# whether anything is listening to each event, worked out as
+		# needed; see subscribed()
+		self._listeners = {}
+		self._wanted = {}
+		self.emit_unsubscribed = False
+
+		# Set while connected; all of these belong to the event loop
+		self._loop = None
+		self._loop_thread = None
+		self._transport = None
+		self._closed = None
+		self._active = False
+		self._paused = False
+
+		# Timing uses the loop's monotonic clock; timers only fire when
+		# the next tick is due or the next queued message may be sent
+		self._last_message_time = 0
+		self._message_queue = OutboundQueue(5000,500)
+		self._next_tick = 0
+		self._tick_timer = None
+		self._queue_timer = None
+		self._queue_scheduled = False
+
+		# The send queue is held until the server has registered us;
+		# anything sent before that would be refused
+		self._registered = False
+
+		# Lines sent while handling a read, or a pass over the send
+		# queue, are collected and written to the transport together;
+		# the transport deals with partial writes and TLS
+		self._write_buffer = []
+		self._write_size = 0
+		self.max_write_size = 65536
+		self.bytes_sent = 0
+		self.lines_sent = 0
+		self.writes = 0
+
+		# Statistics for stats(); only ever updated on the event loop's
+		# thread, so they need no locking
+		self.bytes_received = 0
+		self.lines_received = 0
+		self.command_counts = {}
+		self.parse_time = Histogram()
+		self.dispatch_time = Histogram()
+		self.queue_wait = Histogram()
+		self.stats_sample = 16
+		self._unsampled = 0
+		self.stats_interval = 0
+		self.stats_exporter = None
+
+		# DispatchHooks, and the tracer, if the trace setting was given
+		self._hooks = []
+		self.tracer = None
+
+		self.max_lines_per_read = 100
+		self.read_size = 4096
+		self._buffer = bytearray()
+		self._scanned = 0
+		self._read_buffer = None
+		self._read_view = None
+
+		# Handlers for incoming commands and numerics, keyed by the
+		# upper case command; see register_handler()
+		self._handlers = {
+			"PING": IRCClient._handle_ping,
+			"001": IRCClient._handle_welcome,
+			"433": IRCClient._handle_nick_collision,
+			"PRIVMSG": IRCClient._handle_privmsg,
+			"366": IRCClient._handle_end_of_names,
+			"353": IRCClient._handle_names,
+			"PART": IRCClient._handle_part,
+			"JOIN": IRCClient._handle_join,
+			"QUIT": IRCClient._handle_quit,
+			"NICK": IRCClient._handle_nick,
+			"INVITE": IRCClient._handle_invite,
+			"381": IRCClient._handle_oper,
+			"375": IRCClient._handle_motd_start,
+			"372": IRCClient._handle_motd,
+			"376": IRCClient._handle_motd_end,
+			"004": IRCClient._handle_myinfo,
+			"005": IRCClient._handle_isupport,
+			"318": IRCClient._handle_whois_end,
+			"311": IRCClient._handle_whois_user,
+			"312": IRCClient._handle_whois_server,
+			"313": IRCClient._handle_whois_operator,
+			"317": IRCClient._handle_whois_idle,
+			"319": IRCClient._handle_whois_channels,
+			"KICK": IRCClient._handle_kick,
+			"CAP": IRCClient._handle_cap,
+			"AWAY": IRCClient._handle_away,
+			"ACCOUNT": IRCClient._handle_account,
+			"CHGHOST": IRCClient._handle_chghost,
+			"BATCH": IRCClient._handle_batch,
+			"396": IRCClient._handle_visible_host,
+			"MODE": IRCClient._handle_mode,
+		}
+		for code in ERRORS:
+			self._handlers[code] = IRCClient._handle_error
+
+		self.stream_names = False
+
+		# Opt-in coalescing of events into message_batch events
+		self.batch_signals = False
+		self.batch_size = 100
+		self.batch_interval = 50
+		self._batch = []
+		self._batch_started = 0
+		self._batch_timer = None
+		self._whois = {}
+
+		# whois() lookups waiting for a reply, as folded nick:
+		# [futures,timer,nick]; the timer starts once the WHOIS has been
+		# sent, not while it waits in the send queue. Completed replies, cached until they
+		# expire or the user changes nick or quits
+		self._whois_requests = {}
+		self.whois_timeout = 30
+		self._whois_cache = LRUCache(256,300)
+
+		# Channel membership and status, kept up to date from JOIN,
+		# PART, QUIT, KICK, NICK, MODE and NAMES
+		self._tracker = ChannelTracker()
+
+		self.motd = []
+		self.hostname = "Unknown"
+		self.software = "Unknown"
+
+		# ISUPPORT (005) tokens as the server sent them, True for those
+		# without a value, and the ones the client uses, parsed
+		self.isupport = {}
+		self.network = None
+		self.casemapping = "rfc1459"
+		self.chantypes = "#&"
+		self.nicklen = 9
+		self.modes = 3
+		self.targmax = {}
+
+		# IRCv3 capabilities: those the server offers (with their
+		# values), and those enabled for this connection
+		self.caps_available = {}
+		self.caps = set()
+		self._cap_negotiating = False
+		self._batches = {}
+
+		# Our own user@host as the server relays it, for working out
+		# how much of a PRIVMSG fits in one line; None until we see it
+		self.userhost = None
+
+		# Reconnecting, with exponential backoff, is off unless
+		# configured. Channels we were in when the connection dropped
+		# are rejoined once we've registered again, with the keys last
+		# used to join them. A channel that hasn't answered within
+		# rejoin_timeout seconds is given up on
+		self.reconnect = False
+		self.reconnect_delay = 1
+		self.reconnect_max_delay = 300
+		self.reconnect_attempts = 0
+		self.reconnects = 0
+		self.last_downtime = None
+		self._attempt = 0
+		self._dropped_at = None
+		self._keys = {}	# folded channel: (channel,key)
+		self._rejoin_channels = []
+		self._rejoin = None
+		self._rejoin_timer = None
+		self.rejoin_timeout = 30
+
+		# A ChatLog, if the log_directory setting was given
+		self.log = None
+
+		# A SearchIndex, if the search_directory setting was given
+		self.search = None
+
+		# A Recorder, if the record setting was given
+		self.recorder = None
+
+		self.configure(**kwargs)
+
+	def on(self,event,callback):
+		# Calls callback(data) every time the client emits the event
+		self._listeners.setdefault(event,[]).append(callback)
+		self._wanted = {}
+
+	def off(self,event,callback=None):
+		# Removes one callback from an event, or all of them
+		if callback==None:
+			self._listeners.pop(event,None)
+		elif callback in self._listeners.get(event,[]):
+			self._listeners[event].remove(callback)
+		self._wanted = {}
+
+	def subscribed(self,event):
+		# Whether anything receives the event; events nobody receives
+		# aren't emitted, and the handlers for the busiest don't build
+		# them at all. Set emit_unsubscribed to emit everything anyway
+		wanted = self._wanted
+		subscribed = wanted.get(event)
+		if subscribed==None:
+			subscribed = self._listening(event)
+			wanted[event] = subscribed
+		return subscribed
+
+	def _listening(self,event):
+		# Worked out once per event, until the listeners change; QIRC
+		# adds the receivers of its signals
+		if self.emit_unsubscribed or self._listeners.get(event): return True
+		return self.batch_signals and event!="message_batch" and self.subscribed("message_batch")
+
+	async def connect_and_run(self):
+		# Connects to the server and handles the connection until it's
+		# closed by quit() or stop(), or by the server and reconnecting
+		# is off or has run out of attempts
+		self._loop = asyncio.get_running_loop()
+		self._loop_thread = threading.get_ident()
+		self._active = True
+		self._attempt = 0
+
+		try:
+			while True:
+				self._closed = self._loop.create_future()
+				if await self._connect():
+					try:
+						await self._closed
+					finally:
+						# Cancelled, or stopped while still connecting
+						if self._transport!=None:
+							self._transport.close()
+
+				if not self._active or not self.reconnect: break
+
+				# _attempt is reset once we've registered, so a server that
+				# drops us straight away still gets backed off from
+				self._attempt = self._attempt + 1
+				if self.reconnect_attempts and self._attempt>self.reconnect_attempts: break
+				delay = self._backoff(self._attempt)
+
+				data = {
+					"client": self,
+					"server": self.server,
+					"port": self.port,
+					"attempt": self._attempt,
+					"delay": delay
+				}
+				self._emit("server_disconnect",data)
+
+				# Wait out the delay, unless quit() or stop() is called
+				self._closed = self._loop.create_future()
+				await asyncio.wait([self._closed],timeout=delay)
+				if not self._active: break
+		finally:
+			# Also when cancelled, so nothing written so far is lost
+			self._active = False
+			if self._batch: self._flush_batch()
+			if self.log!=None: self.log.flush()
+			if self.recorder!=None: self.recorder.flush()
+			if self.tracer!=None: self.tracer.save()
+			if self.search!=None:
+				# Waits for the last segment to be written, on another
+				# thread so other connections on the loop carry on
+				await self._loop.run_in_executor(None,self.search.close)
+
+	async def _connect(self):
+		# Returns False if the connection couldn't be made
+		ssl_context = None
+		if self.ssl:
+			ssl_context = self._ssl_context
+			if ssl_context==None:
+				ssl_context = self._create_ssl_context()
+
+		try:
+			await self._loop.create_connection(lambda: Connection(self),self.server,self.port,ssl=ssl_context)
+		except OSError:
+			print("connection error")
+			return False
+		return True
+
+	def _backoff(self,attempt):
+		# Exponential backoff, capped; half of each delay is random so
+		# clients dropped at the same time don't all come back at once
+		delay = min(self.reconnect_max_delay,self.reconnect_delay * 2**(attempt-1))
+		return delay/2 + random.uniform(0,delay/2)
+
+	def _create_ssl_context(self):
+		# Creater SSL/TLS context; it's kept for reconnecting, so the
+		# session from the last connection can be resumed
+		context = ResumableContext(ssl.PROTOCOL_TLS_CLIENT)
+		context.load_default_certs()
+
+		# Set whether to verify hostname or not
+		if self._ssl_verify_hostname:
+			context.check_hostname = True
+		else:
+			context.check_hostname = False
+
+		# Set whether to verify certificate or not
+		if self._ssl_verify_cert:
+			context.verify_mode = ssl.CERT_REQUIRED
+		else:
+			context.verify_mode = ssl.CERT_NONE
+
+		self._ssl_context = context
+		return context
+
+	def _connection_made(self,transport):
+		self._transport = transport
+		self._paused = False
+		self._registered = False
+		self._write_buffer = []
+		self._write_size = 0
+
+		ssl_object = transport.get_extra_info("ssl_object")
+		self.tls_session_reused = ssl_object!=None and ssl_object.session_reused
+
+		# Incoming data is read into a preallocated buffer and framed
+		# on newlines as bytes; each line is decoded on its own
+		self._buffer = bytearray()
+		self._scanned = 0
+		self._read_buffer = bytearray(self.read_size)
+		self._read_view = memoryview(self._read_buffer)
+
+		if self.recorder!=None: self.recorder.connected()
+
+		self._next_tick = self._loop.time() + 1
+		self._tick_timer = self._loop.call_at(self._next_tick,self._tick)
+
+		self._emit("server_connect",{ "client": self, "server": self.server, "port": self.port } )
+
+		# Negotiate IRCv3 capabilities; registration waits for CAP END.
+		# Servers that don't know CAP ignore it and register us anyway
+		self.caps_available = {}
+		self.caps = set()
+		self._batches = {}
+		self._cap_negotiating = True
+		self._send("CAP LS 302")
+
+		# Send server password, if necessary
+		if self.password:
+			self._send(f"PASS {self.password}")
+
+		# Send user information; anything queued up before we
+		# connected waits for the welcome
+		self._send(f"NICK {self.nickname}")
+		self._send(f"USER {self.username} 0 0 :{self.realname}")
+		self._flush_writes()
+
+	def _data_received(self,count):
+		# Add incoming data to the internal buffer
+		self.bytes_received = self.bytes_received + count
+		if self.recorder!=None: self.recorder.received(self._read_view[:count])
+		self._buffer += self._read_view[:count]
+		self._process_incoming()
+
+	def _process_incoming(self):
+		# Dispatch every complete line in the buffer, up to
+		# max_lines_per_read lines at a time; if there are more, stop
+		# reading and let the loop run other callbacks before carrying
+		# on with the backlog
+		pending = self._process_buffer(self.max_lines_per_read)
+		self._flush_writes()
+		if pending:
+			if self._transport!=None and not self._paused:
+				self._transport.pause_reading()
+				self._paused = True
+			self._loop.call_soon(self._process_incoming)
+		elif self._paused:
+			self._paused = False
+			if self._transport!=None:
+				self._transport.resume_reading()
+
+	def _connection_lost(self,exc):
+		self._transport = None
+		self._registered = False
+		if self.recorder!=None: self.recorder.disconnected()
+
+		# Nothing we're waiting on is going to arrive
+		requests = self._whois_requests
+		self._whois_requests = {}
+		self._whois = {}
+		for futures, timer, nickname in requests.values():
+			if timer: timer.cancel()
+			for future in futures:
+				if not future.done():
+					future.set_exception(ConnectionError("disconnected"))
+		if self._tick_timer: self._tick_timer.cancel()
+		if self._queue_timer: self._queue_timer.cancel()
+		if self._rejoin_timer: self._rejoin_timer.cancel()
+		self._rejoin_timer = None
+		self._tick_timer = None
+		self._queue_timer = None
+
+		if self._active:
+			print("disconnection error")
+
+			if self.reconnect:
+				# Remember what to rejoin; if we drop again before
+				# we've rejoined everything, keep the original list
+				if self._dropped_at==None:
+					self._dropped_at = time.monotonic()
+					self._rejoin_channels = [(chan.name,self._keys.get(ckey,(None,None))[1]) for ckey, chan in self._tracker.channels.items()]
+				self._tracker.clear()
+			else:
+				self._active = False
+
+		if self._closed!=None and not self._closed.done():
+			self._closed.set_result(None)
+
+	def _tick(self):
+		self.uptime = self.uptime + 1
+		self._deliver("tick",self.uptime)
+
+		if self.stats_interval and self.uptime%self.stats_interval==0 and self.subscribed("stats_update"):
+			self._deliver("stats_update",self.stats())
+
+		self._next_tick = self._next_tick + 1
+		self._tick_timer = self._loop.call_at(self._next_tick,self._tick)
+
+	def _service_queue(self):
+		# Sends every queued message flood protection allows, then sets
+		# a timer for when the next one may go
+		self._queue_scheduled = False
+		if self._queue_timer:
+			self._queue_timer.cancel()
+			self._queue_timer = None
+		if self._transport==None or not self._registered: return
+
+		while self._message_queue:
+			if self.flood_protection:
+				ready = self._last_message_time + self.flood_protection_send_rate
+				if ready>self._loop.time():
+					self._queue_timer = self._loop.call_at(ready,self._service_queue)
+					break
+			# Everything left may be for channels still being rejoined
+			if not self._send_queue(): break
+
+		self._flush_writes()
+
+	def _call_soon(self,callback,*args):
+		# Runs callback on the event loop's thread; calls from other
+		# threads are handed over to the loop
+		loop = self._loop
+		if loop==None: return
+		if threading.get_ident()==self._loop_thread:
+			callback(*args)
+		else:
+			try:
+				loop.call_soon_threadsafe(callback,*args)
+			except RuntimeError:
+				# The loop has been closed
+				pass
+
+	def _process_buffer(self,limit=0):
+		# Dispatches complete lines from the buffer; a limit of 0 (or
+		# None) drains the buffer completely. Returns True if the limit
+		# was hit with complete lines still waiting in the buffer
+		buff = self._buffer
+		start = 0
+		count = 0
+		pending = False
+		while True:
+			# Don't rescan the part of a partial line we've already seen
+			newline = buff.find(b"\n",max(start,self._scanned))
+
+			# Newline not found, so we'll wait for more incoming data
+			if newline == -1:
+				break
+
+			# Stop if we've hit the per-read cap
+			if limit and count>=limit:
+				pending = True
+				break
+
+			# Grab the incoming line, minus the line ending
+			end = newline
+			if end>start and buff[end-1]==13: end = end - 1
+			line = self._decode(buff[start:end])
+			start = newline + 1
+
+			self._dispatch(line)
+			count = count + 1
+
+		# Remove the dispatched lines from the buffer in one go
+		if start: del buff[:start]
+		self.lines_received = self.lines_received + count
+		self._scanned = 0 if pending else len(buff)
+		return pending
+
+	def _emit(self,signal,data):
+		# Emits an event to its own listeners and, if batching is on,
+		# adds it to the pending message_batch as (signal,data)
+		if not self.subscribed(signal): return
+		self._deliver(signal,data)
+
+		if self.batch_signals:
+			if not self._batch:
+				# A batch goes out batch_interval after its first event,
+				# or sooner once it has batch_size; lines arriving a read
+				# at a time are gathered across reads
+				self._batch_started = time.monotonic()
+				if self._loop!=None:
+					self._batch_timer = self._loop.call_later(self.batch_interval/1000,self._flush_batch)
+			self._batch.append((signal,data))
+			if len(self._batch)>=self.batch_size:
+				self._flush_batch()
+			elif (time.monotonic()-self._batch_started)*1000>=self.batch_interval:
+				self._flush_batch()
+
+	def _flush_batch(self):
+		if self._batch_timer:
+			self._batch_timer.cancel()
+			self._batch_timer = None
+		batch = self._batch
+		if not batch: return
+		self._batch = []
+		self._deliver("message_batch",batch)
+
+	def _deliver(self,event,data):
+		# A callback that raises mustn't take the connection, or the
+		# other callbacks, down with it
+		listeners = self._listeners.get(event)
+		if listeners:
+			for callback in listeners:
+				try:
+					callback(data)
+				except Exception:
+					traceback.print_exc()
+
+	def _decode(self,data):
+		try:
+			# Attempt to decode with the selected encoding
+			return data.decode(self.encoding)
+		except UnicodeDecodeError:
+			# Fall back to "latin1", which can decode anything
+			return data.decode('iso-8859-1')
+
+	def _dispatch(self,line):
+
+		# One line in stats_sample is timed; timing them all would cost
+		# nearly as much as parsing them
+		self._unsampled = self._unsampled + 1
+		if self._unsampled>=self.stats_sample:
+			self._unsampled = 0
+			self._timed_dispatch(line)
+			return
+
+		# Parse the line once; every handler shares the result
+		message = parse_message(line)
+
+		# Ignore blank lines
+		if message==None: return
+
+		self._handle(message)
+
+		#print("<- "+line)
+
+	def _handle(self,message):
+		# Counts the command and runs its handler; a handler that
+		# raises is reported and the next line handled as usual, rather
+		# than the error closing the connection with lines unread
+		command = message.command
+		counts = self.command_counts
+		counts[command] = counts.get(command,0) + 1
+
+		handler = self._handlers.get(command)
+		if handler:
+			try:
+				handler(self,message)
+			except Exception:
+				traceback.print_exc()
+
+		# Any error naming a channel we're rejoining, whether or not
+		# it's one we know, means we won't be let back in
+		if self._rejoin and command[0] in "45" and command.isdigit() and len(message.params)>1:
+			self._rejoin_done(message.params[1])
+
+	def _timed_dispatch(self,line):
+		# _dispatch(), timing the parse and the handler
+		started = time.perf_counter()
+		message = parse_message(line)
+		if message==None: return
+
+		parsed = time.perf_counter()
+		self._handle(message)
+
+		self.parse_time.observe(parsed-started)
+		self.dispatch_time.observe(time.perf_counter()-parsed)
+
+	def _handle_ping(self,message):
+		# Return server ping
+		if message.params:
+			self._send("PONG :" + message.params[0])
+		else:
+			self._send("PONG")
+		data = {
+			"client": self,
+			"server": self.server,
+			"port": self.port
+		}
+		self._emit("server_ping",data)
+
+	def _handle_welcome(self,message):
+		# Server welcome; most servers end it with our full hostmask
+		self._attempt = 0
+		self._save_tls_session()
+
+		# No CAP reply, so the server doesn't do capabilities
+		if self._cap_negotiating:
+			self._cap_negotiating = False
+			self._send_protoctl()
+
+		if message.params:
+			mask = message.params[-1].rsplit(" ",1)[-1]
+			if "!" in mask and "@" in mask:
+				self.userhost = mask.split("!",1)[1]
+
+		data = {
+			"client": self,
+			"server": self.server,
+			"port": self.port
+		}
+		self._emit("server_register",data)
+
+		# Lines for the channels we're rejoining wait until we're back
+		# in them
+		if self._dropped_at!=None:
+			self._start_rejoin()
+		self._registered = True
+		self._service_queue()
+
+	def _save_tls_session(self):
+		# By now the server has sent any TLS 1.3 session tickets
+		if self._transport==None or self._ssl_context==None: return
+		ssl_object = self._transport.get_extra_info("ssl_object")
+		if ssl_object!=None and ssl_object.session!=None:
+			self._ssl_context.session = ssl_object.session
+
+	def _start_rejoin(self):
+		fold = self._tracker.fold
+		self._rejoin = set(fold(channel) for channel, key in self._rejoin_channels)
+		if not self._rejoin:
+			self._rejoined()
+			return
+		for line in join_lines(self._rejoin_channels,max_targets=self.targmax.get("JOIN",0)):
+			self._qsend(line,"",PRIORITY_CONTROL)
+		self._rejoin_timer = self._loop.call_later(self.rejoin_timeout,self._rejoin_expired)
+
+	def _rejoin_expired(self):
+		# Some channels never answered; stop holding their lines
+		self._rejoin_timer = None
+		if not self._rejoin: return
+		self._rejoin = None
+		self._rejoined()
+		self._schedule_queue()
+
+	def _rejoin_done(self,channel):
+		# A channel we were rejoining was joined, or refused us
+		if not self._rejoin: return
+		self._rejoin.discard(self._tracker.fold(channel))
+		if not self._rejoin:
+			self._rejoined()
+		self._schedule_queue()
+
+	def _rejoined(self):
+		if self._rejoin_timer:
+			self._rejoin_timer.cancel()
+			self._rejoin_timer = None
+		downtime = time.monotonic() - self._dropped_at
+		self.reconnects = self.reconnects + 1
+		self.last_downtime = downtime
+
+		data = {
+			"client": self,
+			"server": self.server,
+			"port": self.port,
+			"channels": [channel for channel, key in self._rejoin_channels],
+			"downtime": downtime
+		}
+		self._dropped_at = None
+		self._rejoin_channels = []
+		self._rejoin = None
+		self._emit("server_rejoin",data)
+
+	def _handle_cap(self,message):
+		# CAP <target> <subcommand> [*] :<capabilities>
+		params = message.params
+		if len(params)<3: return
+		subcommand = params[1].upper()
+		more = len(params)>3 and params[2]=="*"
+		caps = params[-1].split()
+
+		if subcommand=="LS" or subcommand=="NEW":
+			for cap in caps:
+				name, equals, value = cap.partition("=")
+				self.caps_available[name] = value
+			if more: return
+			wanted = [name for name in WANTED_CAPS if name in self.caps_available and name not in self.caps]
+			if wanted:
+				self._send("CAP REQ :" + " ".join(wanted))
+			elif self._cap_negotiating:
+				self._end_cap()
+
+		elif subcommand=="ACK":
+			for cap in caps:
+				if cap.startswith("-"):
+					self.caps.discard(cap[1:])
+				else:
+					self.caps.add(cap)
+			if not more and self._cap_negotiating:
+				self._end_cap()
+			elif not more:
+				self._emit_caps()
+
+		elif subcommand=="NAK":
+			if not more and self._cap_negotiating:
+				self._end_cap()
+
+		elif subcommand=="DEL":
+			for cap in caps:
+				self.caps_available.pop(cap,None)
+				self.caps.discard(cap)
+			self._emit_caps()
+
+	def _end_cap(self):
+		self._cap_negotiating = False
+		self._send("CAP END")
+		self._send_protoctl()
+		self._emit_caps()
+
+	def _send_protoctl(self):
+		# Ask servers without (or with only some of) the IRCv3
+		# capabilities for nicks/hostmasks and all status symbols in
+		# NAMES the old way
+		tokens = []
+		if "userhost-in-names" not in self.caps: tokens.append("UHNAMES")
+		if "multi-prefix" not in self.caps: tokens.append("NAMESX")
+		if tokens:
+			self._send("PROTOCTL " + " ".join(tokens))
+
+	def _emit_caps(self):
+		data = {
+			"client": self,
+			"caps": sorted(self.caps),
+			"available": dict(self.caps_available)
+		}
+		self._emit("server_caps",data)
+
+	def _handle_away(self,message):
+		# away-notify; no parameter means they're back
+		if message.nickname==None: return
+		away = message.params[0] if message.params else None
+		self._tracker.away(message.nickname,away)
+
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"away": away!=None,
+			"message": away or ""
+		}
+		self._emit("user_away",data)
+
+	def _handle_account(self,message):
+		# account-notify; "*" means they've logged out
+		if message.nickname==None: return
+		account = message.params[0] if message.params else "*"
+		if account=="*": account = None
+		self._tracker.account(message.nickname,account)
+
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"account": account
+		}
+		self._emit("user_account",data)
+
+	def _handle_chghost(self,message):
+		# chghost; a user's username and/or host changed
+		if len(message.params)<2 or message.nickname==None: return
+		username = message.params[0]
+		host = message.params[1]
+		self._tracker.chghost(message.nickname,username,host)
+		if self._is_me(message.nickname):
+			self.userhost = username + "@" + host
+
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"new": username + "@" + host
+		}
+		self._emit("user_host",data)
+
+	def _handle_batch(self,message):
+		# BATCH +reference type [params...] opens a batch, BATCH
+		# -reference closes it; lines in between are tagged with the
+		# reference and handled as usual
+		if not message.params: return
+		reference = message.params[0]
+
+		if reference.startswith("+"):
+			self._batches[reference[1:]] = {
+				"client": self,
+				"reference": reference[1:],
+				"type": message.params[1] if len(message.params)>1 else "",
+				"params": message.params[2:],
+				"batch": message.tags.get("batch"),
+				"open": True
+			}
+			self._emit("server_batch",self._batches[reference[1:]])
+		elif reference.startswith("-"):
+			data = self._batches.pop(reference[1:],None)
+			if data==None: return
+			data = dict(data)
+			data["open"] = False
+			self._emit("server_batch",data)
+
+	def _handle_nick_collision(self,message):
+		# Nick collision
+		oldnick = self.nickname
+		if self.nickname!=self.alternate:
+			self.nickname = self.alternate
+			self._send(f"NICK {self.nickname}")
+		else:
+			self.nickname = self.nickname + "_"
+			self._send(f"NICK {self.nickname}")
+		data = {
+			"client": self,
+			"old": oldnick,
+			"new": self.nickname
+		}
+		self._emit("nick_collision",data)
+
+	def _handle_privmsg(self,message):
+		# Chat message
+		if not message.params: return
+		target = message.params[0]
+		text = message.params[1] if len(message.params)>1 else ""
+
+		# Which event this is decides whether it's built at all
+		if "\x01ACTION" in text:
+			event = "message_action"
+		elif self._is_me(target):
+			event = "message_private"
+		else:
+			event = "message_public"
+		if not (self.subscribed(event) or self.subscribed("message_all")): return
+
+		msgdata = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"target": target,
+			"message": text,
+			"tags": message.tags,
+			"time": message_time(message)
+		}
+
+		self._emit("message_all",msgdata)
+
+		# CTCP action
+		if event=="message_action":
+			text = text.replace("\x01ACTION",'')
+			text = text[:-1]
+			text = text.strip()
+			msgdata = dict(msgdata)
+			msgdata["message"] = text
+			self._emit("message_action",msgdata)
+			# Exit so this doesn't trigger another message event
+			return
+
+		# Public/private chat
+		self._emit(event,msgdata)
+
+	def _handle_end_of_names(self,message):
+		# User list end
+		if len(message.params)<2: return
+		channel = message.params[1]
+
+		data = {
+			"client": self,
+			"channel": channel,
+			"users": self._tracker.pending_names(channel)
+		}
+
+		self._emit("user_list",data)
+
+		self._tracker.end_names(channel)
+
+	def _handle_names(self,message):
+		# Incoming user list; the channel and the users are always the
+		# last two parameters
+		if len(message.params)<2: return
+		channel = message.params[-2]
+		users = message.params[-1].split()
+
+		# Duplicates are merged as the users are collected
+		self._tracker.names(channel,users)
+
+		if self.stream_names:
+			data = {
+				"client": self,
+				"channel": channel,
+				"users": users
+			}
+			self._emit("user_list_chunk",data)
+
+	def _handle_part(self,message):
+		# PART
+		params = message.params
+		if not params: return
+
+		if self._is_me(message.nickname):
+			self._tracker.remove_channel(params[0])
+		else:
+			self._tracker.part(params[0],message.nickname)
+
+		if not self.subscribed("user_part"): return
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"channel": params[0],
+			"reason": params[1] if len(params)>1 else "",
+			"time": message_time(message)
+		}
+		self._emit("user_part",data)
+
+	def _handle_join(self,message):
+		# JOIN
+		params = message.params
+		if not params or message.nickname==None: return
+		self._tracker.join(params[0],message.nickname,message.username,message.host)
+
+		# extended-join adds the account ("*" if none) and real name
+		account = None
+		realname = None
+		if len(params)>2:
+			account = params[1] if params[1]!="*" else None
+			realname = params[2]
+			self._tracker.account(message.nickname,account)
+
+		if self._is_me(message.nickname):
+			if message.userhost: self.userhost = message.userhost
+			if self._rejoin: self._rejoin_done(params[0])
+
+		if not self.subscribed("user_join"): return
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"channel": params[0],
+			"account": account,
+			"realname": realname,
+			"time": message_time(message)
+		}
+		self._emit("user_join",data)
+
+	def _handle_quit(self,message):
+		# QUIT
+		params = message.params
+		if message.nickname==None: return
+
+		# The channels they were in, since they're about to be forgotten
+		subscribed = self.subscribed("user_quit")
+		if subscribed: channels = self._tracker.user_channels(message.nickname)
+		self._tracker.quit(message.nickname)
+		self._whois_cache.discard(self._tracker.fold(message.nickname))
+
+		if not subscribed: return
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"reason": params[0] if params else "",
+			"channels": channels,
+			"time": message_time(message)
+		}
+		self._emit("user_quit",data)
+
+	def _handle_nick(self,message):
+		# NICK
+		if not message.params or message.nickname==None: return
+		self._tracker.nick(message.nickname,message.params[0])
+		self._whois_cache.discard(self._tracker.fold(message.nickname))
+		self._whois_cache.discard(self._tracker.fold(message.params[0]))
+		if self._is_me(message.nickname):
+			self.nickname = message.params[0]
+
+		if not self.subscribed("user_nick"): return
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"new": message.params[0]
+		}
+		self._emit("user_nick",data)
+
+	def _handle_kick(self,message):
+		# KICK
+		if len(message.params)<2: return
+		channel = message.params[0]
+		target = message.params[1]
+
+		if self._is_me(target):
+			self._tracker.remove_channel(channel)
+		else:
+			self._tracker.part(channel,target)
+
+	def _handle_mode(self,message):
+		# MODE; only channel modes change anything we track
+		params = message.params
+		if len(params)>1:
+			self._tracker.mode(params[0],params[1],params[2:])
+
+	def _handle_visible_host(self,message):
+		# Our host has been changed, by a vhost or cloak
+		if len(message.params)>1 and self.userhost:
+			self.userhost = self.userhost.split("@",1)[0] + "@" + message.params[1]
+
+	def _handle_invite(self,message):
+		# INVITE
+		if len(message.params)<2: return
+		data = {
+			"client": self,
+			"nickname": message.nickname,
+			"host": message.userhost,
+			"channel": message.params[1]
+		}
+		self._emit("user_invite",data)
+
+	def _handle_oper(self,message):
+		# OPER
+		data = {
+			"client": self,
+			"server": self.server,
+			"port": self.port
+		}
+		self._emit("user_oper",data)
+
+	def _handle_motd_start(self,message):
+		# MOTD begins
+		self.motd = []
+
+	def _handle_motd(self,message):
+		# MOTD content, minus the leading "- "
+		if not message.params: return
+		data = message.params[-1]
+		data = data[2:]
+		data = data.strip()
+		self.motd.append(data)
+
+	def _handle_motd_end(self,message):
+		# MOTD ends
+		motd = "\n".join(self.motd)
+		motd = motd.strip()
+		self._emit("server_motd",motd)
+
+	def _handle_myinfo(self,message):
+		# 004
+		if len(message.params)<3: return
+		self.hostname = message.params[1]
+		self.software = message.params[2]
+		self._emit("server_hostname",self.hostname)
+
+	def _handle_isupport(self,message):
+		# ISUPPORT; every parameter but our nick and the trailing text
+		# is a token
+		for token in message.params[1:-1]:
+			if token.startswith("-"):
+				self.isupport.pop(token[1:],None)
+				continue
+
+			name, equals, value = token.partition("=")
+			if equals:
+				value = unescape_isupport(value)
+			else:
+				value = True
+			self.isupport[name] = value
+			if value==True: value = ""
+
+			if name=="PREFIX":
+				self._tracker.set_prefixes(value or "()")
+
+			elif name=="CHANMODES":
+				self._tracker.set_channel_modes(value)
+
+			elif name=="CASEMAPPING":
+				self._set_casemapping(value)
+
+			elif name=="CHANTYPES":
+				self.chantypes = value
+
+			elif name=="NETWORK":
+				self.network = value
+
+			elif name=="NICKLEN":
+				self.nicklen = int(value) if value.isdigit() else self.nicklen
+
+			elif name=="MODES":
+				# No value means no limit
+				self.modes = int(value) if value.isdigit() else 0
+
+			elif name=="TARGMAX":
+				# COMMAND:limit pairs; no limit is given as 0
+				self.targmax = {}
+				for entry in value.split(","):
+					command, colon, limit = entry.partition(":")
+					if command:
+						self.targmax[command.upper()] = int(limit) if limit.isdigit() else 0
+
+	def _set_casemapping(self,casemapping):
+		self.casemapping = casemapping
+		old = self._tracker.fold
+		self._tracker.set_casemapping(casemapping)
+
+		# Everything else keyed on folded names has to follow
+		fold = self._tracker.fold
+		self._keys = { fold(channel): (channel,key) for channel, key in self._keys.values() }
+		self._whois = { fold(w["nickname"]): w for w in self._whois.values() }
+		self._whois_cache.clear()
+		self._message_queue.rekey(fold)
+		requests = {}
+		for request in self._whois_requests.values():
+			other = requests.get(fold(request[2]))
+			if other!=None:
+				# Two spellings of one nick; the first lookup answers both
+				other[0].extend(request[0])
+				if request[1]: request[1].cancel()
+			else:
+				requests[fold(request[2])] = request
+		self._whois_requests = requests
+		if self._rejoin:
+			self._rejoin = set(fold(channel) for channel, key in self._rejoin_channels if old(channel) in self._rejoin)
+
+	def _handle_whois_end(self,message):
+		# ENDOFWHOIS
+		if len(message.params)<2: return
+		nickname = message.params[1]
+		key = self._tracker.fold(nickname)
+
+		data = self._whois.pop(key,None)
+		if data!=None:
+			self._whois_cache.set(key,data)
+			self._emit("user_whois",data)
+		self._finish_whois(key,data)
+
+	def _handle_whois_user(self,message):
+		# WHOISUSER
+		params = message.params
+		if len(params)<4: return
+		nickname = params[1]
+		key = self._tracker.fold(nickname)
+
+		wdata = {
+			"client": self,
+			"nickname": nickname,
+			"username": params[2],
+			"host": params[3],
+			"privileges": "None",
+			"server": "Unknown",
+			"idle": 0,
+			"signon": 0,
+			"channels": []
+		}
+		self._whois[key] = wdata
+
+	def _handle_whois_server(self,message):
+		# WHOISSERVER
+		params = message.params
+		if len(params)<3: return
+		nickname = params[1]
+		key = self._tracker.fold(nickname)
+
+		if key in self._whois:
+			self._whois[key]["server"] = params[2]+"("+params[-1]+")"
+
+	def _handle_whois_operator(self,message):
+		# WHOISOPERATOR
+		if len(message.params)<2: return
+		nickname = message.params[1]
+		key = self._tracker.fold(nickname)
+
+		if key in self._whois:
+			self._whois[key]["privileges"] = nickname + " " + message.params[-1]
+
+	def _handle_whois_idle(self,message):
+		# WHOISIDLE
+		params = message.params
+		if len(params)<2: return
+		nickname = params[1]
+		key = self._tracker.fold(nickname)
+
+		try:
+			idle = int(params[2])
+		except:
+			idle = 0
+
+		try:
+			signon = int(params[3])
+		except:
+			signon = 0
+
+		if key in self._whois:
+			w = self._whois[key]
+			w["idle"] = idle
+			w["signon"] = signon
+
+	def _handle_whois_channels(self,message):
+		# WHOISCHANNELS
+		if len(message.params)<2: return
+		nickname = message.params[1]
+		key = self._tracker.fold(nickname)
+
+		if key in self._whois:
+			self._whois[key]["channels"] = message.params[-1].split()
+
+	def _finish_whois(self,key,data):
+		# Completes every whois() lookup for the nick; data is None if
+		# there's no such user
+		request = self._whois_requests.pop(key,None)
+		if request==None: return
+		futures, timer, nickname = request
+		if timer: timer.cancel()
+		for future in futures:
+			if not future.done():
+				future.set_result(dict(data) if data!=None else None)
+
+	def _whois_timed_out(self,nickname):
+		key = self._tracker.fold(nickname)
+		request = self._whois_requests.pop(key,None)
+		if request==None: return
+		self._whois.pop(key,None)
+		for future in request[0]:
+			if not future.done():
+				future.set_exception(TimeoutError("WHOIS timed out"))
+
+	def _handle_error(self,message):
+		# Error management
+		ERRORS[message.command](self,message.command,message)
+
+		# Some servers don't follow "no such nick" with an ENDOFWHOIS
+		if message.command=="401" and len(message.params)>1:
+			self._finish_whois(self._tracker.fold(message.params[1]),None)
+
+
+	def stop(self):
+		# Closes the connection without sending QUIT
+		self._active = False
+		self._call_soon(self._close)
+
+	def send(self,data,priority=PRIORITY_INTERACTIVE):
+		return self._qsend(data,"",priority)
+
+	def pending(self,target=None):
+		# Messages still waiting for flood protection, to one target
+		# or to all of them
+		if target!=None: target = self._tracker.fold(target)
+		return self._message_queue.pending(target)
+
+	def cancel(self,target=None):
+		# Drops the messages waiting to be sent to one target, or all
+		# of them; returns how many were dropped
+		if target!=None: target = self._tracker.fold(target)
+		count = self._message_queue.cancel(target)
+		if count and not target: self._call_soon(self._drop_unsent_whois)
+		return count
+
+	def stats(self):
+		# A snapshot of the connection's counters; safe to call from
+		# any thread, though counts may be a line or two apart. The
+		# parse_time and dispatch_time histograms are of one line in
+		# stats_sample
+		return {
+			"server": self.server,
+			"port": self.port,
+			"nickname": self.nickname,
+			"connected": self._transport!=None,
+			"uptime": self.uptime,
+			"bytes_received": self.bytes_received,
+			"lines_received": self.lines_received,
+			"bytes_sent": self.bytes_sent,
+			"lines_sent": self.lines_sent,
+			"writes": self.writes,
+			"commands": self.command_counts.copy(),
+			"parse_time": self.parse_time.snapshot(),
+			"dispatch_time": self.dispatch_time.snapshot(),
+			"queue_depth": len(self._message_queue),
+			"queue_wait": self.queue_wait.snapshot(),
+			"receive_buffer": len(self._buffer),
+			"reconnects": self.reconnects,
+			"reconnect_attempt": self._attempt,
+			"last_downtime": self.last_downtime
+		}
+
+	def channels(self):
+		# Names of the channels the client is in
+		return [chan.name for chan in list(self._tracker.channels.values())]
+
+	def channel_members(self,channel):
+		return self._tracker.members(channel)
+
+	def nick_channels(self,nickname):
+		# Names of the channels we share with a user
+		return self._tracker.user_channels(nickname)
+
+	def user_status(self,channel,nickname):
+		return self._tracker.status(channel,nickname)
+
+	def is_op(self,channel,nickname):
+		return self._tracker.is_op(channel,nickname)
+
+	def user_info(self,nickname):
+		# What we know about a user we share a channel with, or None
+		user = self._tracker.user(nickname)
+		if user==None: return None
+		return {
+			"nickname": user.nickname,
+			"username": user.username,
+			"host": user.host,
+			"account": user.account,
+			"away": user.away!=None,
+			"away_message": user.away or "",
+			"channels": [self._tracker.channels[ckey].name for ckey in user.channels]
+		}
+
+	def fold(self,name):
+		# A nick or channel name folded by the server's CASEMAPPING,
+		# for comparing names or keying things by them
+		return self._tracker.fold(name)
+
+	def is_me(self,nickname):
+		# Whether nickname is ours, by the server's CASEMAPPING
+		return self._is_me(nickname)
+
+	def _is_me(self,nickname):
+		if nickname==None: return False
+		if nickname==self.nickname: return True
+		return self._tracker.fold(nickname)==self._tracker.fold(self.nickname)
+
+	def register_handler(self,command,handler):
+		# Sets the function called with (client,message) when the
+		# server sends a command or numeric, replacing (and returning)
+		# any handler already set for it
+		command = normalize_command(command)
+		previous = self._handlers.get(command)
+		self._handlers[command] = handler
+		return previous
+
+	def remove_handler(self,command):
+		# Stops handling a command or numeric; returns the removed
+		# handler, or None if there wasn't one
+		return self._handlers.pop(normalize_command(command),None)
+
+	def get_handler(self,command):
+		return self._handlers.get(normalize_command(command))
+
+	def add_hook(self,hook):
+		# Calls hook.before(stage,detail) and hook.after(stage,detail)
+		# around each stage of handling incoming data; see DispatchHook
+		self._hooks = self._hooks + [hook]
+		self._install_hooks()
+
+	def remove_hook(self,hook):
+		self._hooks = [other for other in self._hooks if other is not hook]
+		self._install_hooks()
+
+	def _install_hooks(self):
+		# With no hooks, the stages are the plain methods and cost
+		# nothing extra; with hooks, each is shadowed on the instance
+		# by a hooked version
+		cls = type(self)
+		if not self._hooks:
+			for name in ("_data_received", "_decode", "_dispatch", "_deliver"):
+				self.__dict__.pop(name,None)
+			return
+		self._data_received = self._hooked("receive",cls._data_received.__get__(self))
+		self._decode = self._hooked("decode",cls._decode.__get__(self))
+		self._dispatch = self._hooked_dispatch
+		self._deliver = self._hooked("emit",cls._deliver.__get__(self))
+
+	def _hooked(self,stage,function):
+		def hooked(detail,*args):
+			hooks = self._hooks
+			for hook in hooks:
+				hook.before(stage,detail)
+			try:
+				return function(detail,*args)
+			finally:
+				for hook in reversed(hooks):
+					hook.after(stage,detail)
+		return hooked
+
+	def _hooked_dispatch(self,line):
+		# _dispatch(), with the parse and dispatch stages hooked; the
+		# same one line in stats_sample is timed, leaving the hooks
+		# out of the times
+		self._unsampled = self._unsampled + 1
+		sampled = self._unsampled>=self.stats_sample
+		if sampled: self._unsampled = 0
+
+		hooks = self._hooks
+		for hook in hooks:
+			hook.before("parse",line)
+		try:
+			started = time.perf_counter()
+			message = parse_message(line)
+			parsed = time.perf_counter()
+		finally:
+			for hook in reversed(hooks):
+				hook.after("parse",line)
+		if message==None: return
+
+		for hook in hooks:
+			hook.before("dispatch",message)
+		try:
+			dispatched = time.perf_counter()
+			self._handle(message)
+			handled = time.perf_counter()
+		finally:
+			for hook in reversed(hooks):
+				hook.after("dispatch",message)
+
+		if sampled:
+			self.parse_time.observe(parsed-started)
+			self.dispatch_time.observe(handled-dispatched)
+
+	def privmsg(self,target,message,priority=PRIORITY_INTERACTIVE):
+		# Long messages, and every line of a multi-line one, are sent
+		# as separate messages; returns False if they were dropped
+		return self._qsend_lines(self.format_message("PRIVMSG",target,message),target,priority)
+
+	def notice(self,target,message,priority=PRIORITY_INTERACTIVE):
+		return self._qsend_lines(self.format_message("NOTICE",target,message),target,priority)
+
+	def format_message(self,command,target,message):
+		# Returns the lines that send message to target, each of them
+		# short enough for the server to relay whole. A CTCP message
+		# (like an ACTION) is split inside its framing, and every piece
+		# framed again
+		start = command + " " + target + " :"
+		end = ""
+		if message.startswith("\x01"):
+			body = message[1:-1] if message.endswith("\x01") else message[1:]
+			ctcp, space, message = body.partition(" ")
+			if not space: return [start + "\x01" + ctcp + "\x01"]
+			start = start + "\x01" + ctcp + " "
+			end = "\x01"
+		budget = MESSAGE_LENGTH - len(self._prefix_estimate().encode(self.encoding)) - len((start + end).encode(self.encoding))
+		return [start + piece + end for piece in split_text(message,max(budget,MIN_SPLIT),self.encoding)]
+
+	def _prefix_estimate(self):
+		# The prefix the server puts on what we send; until we know our
+		# user@host, assume the longest a server is likely to give us
+		userhost = self.userhost
+		if userhost==None:
+			userhost = "~" + self.username + "@" + "x"*HOST_LENGTH
+		return ":" + self.nickname + "!" + userhost + " "
+
+	def whois(self,nickname,callback=None,cached=True):
+		# Looks the user up; returns a concurrent.futures.Future that
+		# gets the same dict as the user_whois event, or None if
+		# there's no such user. If callback is given, it's called with
+		# that dict, or None (also on timeout or disconnection), on
+		# the event loop's thread. Lookups for a nick already being
+		# looked up share one WHOIS; recent replies come from the cache
+		future = concurrent.futures.Future()
+		if callback!=None:
+			def done(future):
+				if future.cancelled() or future.exception()!=None:
+					callback(None)
+				else:
+					callback(future.result())
+			future.add_done_callback(done)
+
+		if self._loop==None or not self._active:
+			future.set_exception(ConnectionError("not connected"))
+		else:
+			self._call_soon(self._request_whois,nickname,future,cached)
+		return future
+
+	def _request_whois(self,nickname,future,cached):
+		key = self._tracker.fold(nickname)
+
+		if cached:
+			data = self._whois_cache.get(key)
+			if data!=None:
+				future.set_result(dict(data))
+				return
+
+		request = self._whois_requests.get(key)
+		if request!=None:
+			request[0].append(future)
+			return
+
+		self._whois_requests[key] = [[future],None,nickname]
+		if not self._qsend("WHOIS "+nickname,""):
+			del self._whois_requests[key]
+			future.set_exception(RuntimeError("send queue full"))
+
+	def _drop_unsent_whois(self):
+		# Fails the lookups whose WHOIS was cancelled from the queue
+		# before it was sent; nothing is going to answer them
+		queued = set(self._message_queue.pending(""))
+		for key, request in list(self._whois_requests.items()):
+			if request[1]==None and "WHOIS "+request[2] not in queued:
+				del self._whois_requests[key]
+				for future in request[0]:
+					future.cancel()
+
+	def _whois_sent(self,nickname):
+		# The WHOIS has left the send queue; now start waiting
+		request = self._whois_requests.get(self._tracker.fold(nickname))
+		if request!=None and request[1]==None:
+			request[1] = self._loop.call_later(self.whois_timeout,self._whois_timed_out,nickname)
+
+	def join(self,channel,key=None):
+		if key!=None:
+			self._keys[self._tracker.fold(channel)] = (channel,key)
+		if key==None:
+			self._qsend("JOIN "+channel,channel)
+		else:
+			self._qsend("JOIN "+channel+" "+key,channel)
+
+	def part(self,channel,message=None):
+		if message==None:
+			self._qsend("PART "+channel,channel)
+		else:
+			self._qsend("PART "+channel+" "+message,channel)
+
+	def quit(self,reason=None):
+		# QUIT skips the queue; the connection is closed as soon as
+		# it's been sent
+		self._active = False
+		self._call_soon(self._quit,reason)
+
+	def _quit(self,reason):
+		if reason==None:
+			self._send("QUIT")
+		else:
+			self._send("QUIT "+reason)
+		self._close()
+
+	def _close(self):
+		# Closing the transport flushes anything already written
+		if self._transport!=None:
+			self._flush_writes()
+			self._transport.close()
+		elif self._closed!=None and not self._closed.done():
+			self._closed.set_result(None)
+
+	def _send_queue(self):
+		# Returns False if nothing could be sent
+		entry = self._message_queue.pop(self._rejoin)
+		if entry==None: return False
+		line = entry[0]
+		self.queue_wait.observe(time.monotonic()-entry[1])
+		self._send(line)
+		if line.startswith("WHOIS "): self._whois_sent(line[6:])
+		return True
+
+	def _qsend(self,msg,target="",priority=PRIORITY_INTERACTIVE):
+		# Every message goes through the queue, so messages keep their
+		# order and priority. Returns False if the message was dropped
+		# because the queue is full
+		if not self._message_queue.push(msg,self._tracker.fold(target),priority,target):
+			print("send queue full, dropping message")
+			return False
+		self._schedule_queue()
+		return True
+
+	def _qsend_lines(self,lines,target="",priority=PRIORITY_INTERACTIVE):
+		# Queues the lines together, or drops them all if they don't fit
+		if not self._message_queue.extend(lines,self._tracker.fold(target),priority,target):
+			print("send queue full, dropping message")
+			return False
+		self._schedule_queue()
+		return True
+
+	def _schedule_queue(self):
+		# Messages sent from other threads while the loop is busy are
+		# all picked up by one pass over the queue
+		if not self._queue_scheduled:
+			self._queue_scheduled = True
+			self._call_soon(self._service_queue)
+
+	def _send(self,data):
+		# Only ever called on the event loop's thread; other threads go
+		# through _qsend() and the send queue
+		self._last_message_time = time.monotonic()
+
+		if self._transport!=None:
+			line = bytes(data + "\r\n", self.encoding)
+			self._write_buffer.append(line)
+			self._write_size = self._write_size + len(line)
+			if self._write_size>=self.max_write_size:
+				self._flush_writes()
+
+	def _flush_writes(self):
+		# Writes every collected line in one go
+		if not self._write_buffer: return
+		lines = self._write_buffer
+		self._write_buffer = []
+		self._write_size = 0
+		if self._transport==None: return
+
+		data = b"".join(lines)
+		if self.recorder!=None: self.recorder.sent(data)
+		self._transport.write(data)
+		self.bytes_sent = self.bytes_sent + len(data)
+		self.lines_sent = self.lines_sent + len(lines)
+		self.writes = self.writes + 1
+
+	def configure(self,**kwargs):
+
+		for key, value in kwargs.items():
+
+			if key=="verify_hostname":
+				self._ssl_verify_hostname = value
+
+			if key=="verify_certificate":
+				self._ssl_verify_cert = value
+
+			if key=="ssl":
+				self.ssl = value
+				if self.ssl:
+					if SSL_AVAILABLE==False:
+						raise RuntimeError('SSL/TLS is not available. Please install pyOpenSSL.')
+
+			if key=="flood_protection":
+				self.flood_protection = value
+
+			if key=="flood_protection_send_rate":
+				self.flood_protection_send_rate = value
+
+			if key=="queue_limit":
+				self._message_queue.limit = value
+
+			if key=="queue_target_limit":
+				self._message_queue.target_limit = value
+
+			if key=="reconnect":
+				self.reconnect = value
+
+			if key=="reconnect_delay":
+				self.reconnect_delay = value
+
+			if key=="reconnect_max_delay":
+				self.reconnect_max_delay = value
+
+			if key=="reconnect_attempts":
+				self.reconnect_attempts = value
+
+			if key=="rejoin_timeout":
+				self.rejoin_timeout = value
+
+			if key=="encoding":
+				self.encoding = value
+
+			if key=="whois_timeout":
+				self.whois_timeout = value
+
+			if key=="whois_cache_size":
+				self._whois_cache.limit = value
+
+			if key=="whois_cache_ttl":
+				self._whois_cache.ttl = value
+
+			if key=="log_directory":
+				# Log chat to disk from the event loop's thread
+				from qirc_log import ChatLog
+				self.log = ChatLog(value)
+				self.log.attach(self)
+
+			if key=="record":
+				# Record raw traffic, for replaying with qirc_record
+				from qirc_record import Recorder
+				if self.recorder!=None: self.recorder.close()
+				self.recorder = Recorder(value)
+
+			if key=="search_directory":
+				# Index chat for search()ing, merging on a thread of its own
+				from qirc_search import SearchIndex
+				self.search = SearchIndex(value)
+				self.search.attach(self)
+
+			if key=="stats_sample":
+				# Time one line in this many for the parse_time and
+				# dispatch_time histograms
+				self.stats_sample = max(1,value)
+
+			if key=="trace":
+				# Record a Chrome trace to this file, or stop recording
+				# and write it out if it's None
+				if self.tracer!=None:
+					self.remove_hook(self.tracer)
+					self.tracer.save()
+					self.tracer = None
+				if value:
+					from qirc_trace import Tracer
+					self.tracer = Tracer(value)
+					self.add_hook(self.tracer)
+
+			if key=="stats_interval":
+				# Seconds between stats_update events; 0 for none
+				self.stats_interval = value
+
+			if key=="stats_port":
+				# Serve stats() to Prometheus on a local port
+				from qirc_stats import StatsExporter
+				self.stats_exporter = StatsExporter([self],value)
+				self.stats_exporter.start()
+
+			if key=="max_write_size":
+				self.max_write_size = value
+
+			if key=="max_lines_per_read":
+				self.max_lines_per_read = value
+
+			if key=="read_size":
+				self.read_size = value
+
+			if key=="stream_names":
+				self.stream_names = value
+
+			if key=="batch_signals":
+				self.batch_signals = value
+				self._wanted = {}
+
+			if key=="emit_unsubscribed":
+				self.emit_unsubscribed = value
+				self._wanted = {}
+
+			if key=="batch_size":
+				self.batch_size = value
+
+			if key=="batch_interval":
+				self.batch_interval = value
+
+			if key=="password":
+				self.password = value
+
+			if key=="alternate":
+				self.alternate = value
+
+			if key=="nickname":
+				self.nickname = value
+
+			if key=="username":
+				self.username = value
+
+			if key=="realname":
+				self.realname = value
+
+			if key=="parent":
+				self.parent = value
+
+			if key=="nickname":
+				self.nickname = value
+
+			if key=="server":
+				self.server = value
+
+			if key=="port":
+				self.port = value
+
+if SSL_AVAILABLE:
+
+	class ResumableContext(ssl.SSLContext):
+
+		# asyncio doesn't let us pass a session when it wraps a
+		# connection, so the context supplies the last one it saw
+
+		session = None
+
+		def wrap_bio(self,incoming,outgoing,server_side=False,server_hostname=None,session=None):
+			if session==None and not server_side:
+				session = self.session
+			return ssl.SSLContext.wrap_bio(self,incoming,outgoing,server_side,server_hostname,session)
+
+class Connection(asyncio.BufferedProtocol):
+
+	# Hands what an asyncio transport reads straight to its IRCClient;
+	# data is read into the client's preallocated buffer
+
+	def __init__(self,client):
+		self.client = client
+
+	def connection_made(self,transport):
+		self.client._connection_made(transport)
+
+	def get_buffer(self,sizehint):
+		return self.client._read_view
+
+	def buffer_updated(self,nbytes):
+		self.client._data_received(nbytes)
+
+	def eof_received(self):
+		# Close our end too
+		return False
+
+	def connection_lost(self,exc):
+		self.client._connection_lost(exc)
+
+class ConnectionManager:
+
+	# Runs many IRCClients over a small, fixed number of threads, each
+	# with one event loop (and so one selector, epoll where available)
+	# multiplexing every connection on it. New clients go to the
+	# thread with the fewest connections. Events are delivered on the
+	# thread the client runs on.
+	#
+	#   manager = ConnectionManager(threads=2)
+	#   client = manager.create(server="localhost",port=6667)
+	#   client.on("message_public",print)
+	#   manager.start()
+
+	def __init__(self,threads=1):
+		self.threads = threads
+		self._shards = []
+		self._waiting = []
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		with self._lock:
+			return len(self._waiting) + sum(len(shard.clients) for shard in self._shards)
+
+	def clients(self):
+		with self._lock:
+			clients = list(self._waiting)
+			for shard in self._shards:
+				clients.extend(shard.clients)
+			return clients
+
+	def create(self,**kwargs):
+		# Creates an IRCClient with the given settings and adds it
+		client = IRCClient(**kwargs)
+		self.add(client)
+		return client
+
+	def add(self,client):
+		# Connects the client now if the manager is running, otherwise
+		# as soon as it's started
+		with self._lock:
+			if not self._shards:
+				self._waiting.append(client)
+				return
+			shard = min(self._shards,key=lambda shard: len(shard.clients))
+			shard.add(client)
+
+	def remove(self,client):
+		# Disconnects the client and forgets it
+		with self._lock:
+			if client in self._waiting:
+				self._waiting.remove(client)
+				return
+			for shard in self._shards:
+				if client in shard.clients:
+					shard.remove(client)
+					return
+
+	def start(self):
+		with self._lock:
+			if self._shards: return
+			for i in range(max(1,self.threads)):
+				self._shards.append(Shard(f"qirc-{i}"))
+			waiting = self._waiting
+			self._waiting = []
+			for i, client in enumerate(waiting):
+				self._shards[i%len(self._shards)].add(client)
+
+	def stop(self,timeout=None):
+		# Closes every connection and stops the threads
+		with self._lock:
+			shards = self._shards
+			self._shards = []
+		for shard in shards:
+			shard.stop(timeout)
+
+class Shard:
+
+	# One thread running one event loop for ConnectionManager
+
+	def __init__(self,name):
+		self.clients = {}
+		self.loop = asyncio.new_event_loop()
+		self.thread = threading.Thread(target=self._run,name=name,daemon=True)
+		self.thread.start()
+
+	def _run(self):
+		asyncio.set_event_loop(self.loop)
+		self.loop.run_forever()
+
+		# Let cancelled connections clean up before closing the loop
+		tasks = asyncio.all_tasks(self.loop)
+		self.loop.run_until_complete(asyncio.gather(*tasks,return_exceptions=True))
+		self.loop.close()
+
+	def add(self,client):
+		self.clients[client] = asyncio.run_coroutine_threadsafe(client.connect_and_run(),self.loop)
+
+	def remove(self,client):
+		# connect_and_run() cleans up even if it's cancelled
+		future = self.clients.pop(client)
+		client.stop()
+		future.cancel()
+
+	def stop(self,timeout=None):
+		# Gives the clients timeout seconds to finish closing (writing
+		# out logs, search segments and traces) before cancelling them
+		for client in self.clients:
+			client.stop()
+		done, running = concurrent.futures.wait(list(self.clients.values()),timeout)
+		for future in running:
+			future.cancel()
+		self.clients = {}
+		self.loop.call_soon_threadsafe(self.loop.stop)
+		self.thread.join(timeout)
+
+class OutboundQueue:
+
+	# Messages waiting for flood protection to let them through.
+	# Higher priority lanes are always emptied first; within a lane,
+	# targets take turns, so a long paste to one channel doesn't hold
+	# up messages to any other. Each entry is (line,time queued).
+
+	def __init__(self,limit=0,target_limit=0):
+		self.limit = limit
+		self.target_limit = target_limit
+		self._lanes = [ {} for i in range(PRIORITY_BULK+1) ]
+		self._turns = [ deque() for i in range(PRIORITY_BULK+1) ]
+		self._names = {}	# target: the name it was folded from
+		self._size = 0
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return self._size
+
+	def push(self,line,target="",priority=PRIORITY_INTERACTIVE,name=None):
+		# Returns False if the message was dropped because the queue,
+		# or the target's share of it, is full. name is the target as
+		# given, before folding, for rekey()
+		with self._lock:
+			if self.limit and self._size>=self.limit: return False
+			lane = self._lanes[priority]
+			pending = lane.get(target)
+			if pending==None:
+				pending = deque()
+				lane[target] = pending
+				self._turns[priority].append(target)
+				self._names[target] = name if name!=None else target
+			elif self.target_limit and len(pending)>=self.target_limit:
+				return False
+			pending.append((line,time.monotonic()))
+			self._size = self._size + 1
+			return True
+
+	def extend(self,lines,target="",priority=PRIORITY_INTERACTIVE,name=None):
+		# Queues several lines at once; all of them or none
+		with self._lock:
+			if self.limit and self._size+len(lines)>self.limit: return False
+			lane = self._lanes[priority]
+			pending = lane.get(target)
+			if pending!=None and self.target_limit and len(pending)+len(lines)>self.target_limit:
+				return False
+			if not lines: return True
+			if pending==None:
+				pending = deque()
+				lane[target] = pending
+				self._turns[priority].append(target)
+				self._names[target] = name if name!=None else target
+			queued = time.monotonic()
+			pending.extend((line,queued) for line in lines)
+			self._size = self._size + len(lines)
+			return True
+
+	def pop(self,held=None):
+		# Returns the next (line,time queued), or None; targets in held
+		# are passed over, and wait at the back for their turn
+		with self._lock:
+			for priority in range(PRIORITY_BULK+1):
+				turns = self._turns[priority]
+				if not turns: continue
+				if held:
+					for i in range(len(turns)):
+						if turns[0] not in held: break
+						turns.rotate(-1)
+					else:
+						continue
+				lane = self._lanes[priority]
+				target = turns.popleft()
+				pending = lane[target]
+				entry = pending.popleft()
+				if pending:
+					turns.append(target)
+				else:
+					del lane[target]
+					self._forget(target)
+				self._size = self._size - 1
+				return entry
+			return None
+
+	def pending(self,target=None):
+		# Lines waiting to be sent, in priority order, to one target or
+		# to all of them
+		with self._lock:
+			lines = []
+			for lane in self._lanes:
+				for key, pending in lane.items():
+					if target==None or key==target:
+						lines.extend(line for line, queued in pending)
+			return lines
+
+	def cancel(self,target=None):
+		# Drops the lines waiting to be sent to one target, or all of
+		# them; returns how many were dropped
+		with self._lock:
+			count = 0
+			for priority in range(PRIORITY_BULK+1):
+				lane = self._lanes[priority]
+				if target==None:
+					count = count + sum(len(pending) for pending in lane.values())
+					lane.clear()
+					self._turns[priority].clear()
+				elif target in lane:
+					count = count + len(lane.pop(target))
+					self._turns[priority].remove(target)
+			if target==None:
+				self._names.clear()
+			else:
+				self._forget(target)
+			self._size = self._size - count
+			return count
+
+	def rekey(self,fold):
+		# Folds every target's name again, when the casemapping has
+		# changed; targets that now fold the same are merged
+		with self._lock:
+			names = {}
+			for priority in range(PRIORITY_BULK+1):
+				old = self._lanes[priority]
+				lane = {}
+				turns = deque()
+				for target in self._turns[priority]:
+					name = self._names.get(target,target)
+					key = fold(name)
+					if key in lane:
+						lane[key].extend(old[target])
+					else:
+						lane[key] = old[target]
+						turns.append(key)
+					names[key] = name
+				self._lanes[priority] = lane
+				self._turns[priority] = turns
+			self._names = names
+
+	def _forget(self,target):
+		# Called with the lock held, once a target has nothing queued
+		for lane in self._lanes:
+			if target in lane: return
+		self._names.pop(target,None)
+
+class DispatchHook:
+
+	# Called around each stage of handling incoming data, on the
+	# event loop's thread, with the stage and a detail:
+	#
+	#   receive    the number of bytes read; covers everything below
+	#   decode     the raw line
+	#   parse      the decoded line
+	#   dispatch   the parsed Message, while its handler runs
+	#   emit       the event name, while its signal and listeners run
+	#
+	# Subclass it, override what's needed and pass it to add_hook()
+
+	def before(self,stage,detail):
+		pass
+
+	def after(self,stage,detail):
+		pass
+
+# Upper bounds, in seconds, of the Histogram buckets; anything
+# slower goes in a last bucket of its own
+HISTOGRAM_BOUNDS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+
+	# Counts of timings by bucket, plus their count and sum. Not
+	# thread safe; each client only updates its own on its loop's
+	# thread, and snapshot() copies are good enough to read from
+	# anywhere
+
+	def __init__(self,bounds=HISTOGRAM_BOUNDS):
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds)+1)
+		self.count = 0
+		self.sum = 0
+
+	def observe(self,value):
+		self.counts[bisect.bisect_left(self.bounds,value)] += 1
+		self.count = self.count + 1
+		self.sum = self.sum + value
+
+	def snapshot(self):
+		# Cumulative counts, as (upper bound,count) with None for the
+		# last, unbounded bucket
+		buckets = []
+		total = 0
+		for bound, count in zip(self.bounds+(None,),list(self.counts)):
+			total = total + count
+			buckets.append((bound,total))
+		return { "count": self.count, "sum": self.sum, "buckets": buckets }
+
+class LRUCache:
+
+	# A dict that holds at most limit entries, dropping the least
+	# recently used, each for at most ttl seconds (if set)
+
+	def __init__(self,limit,ttl=0):
+		self.limit = limit
+		self.ttl = ttl
+		self._entries = OrderedDict()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self,key):
+		entry = self._entries.get(key)
+		if entry==None: return None
+		value, expires = entry
+		if expires and expires<time.monotonic():
+			del self._entries[key]
+			return None
+		self._entries.move_to_end(key)
+		return value
+
+	def set(self,key,value):
+		expires = time.monotonic() + self.ttl if self.ttl else 0
+		self._entries[key] = (value,expires)
+		self._entries.move_to_end(key)
+		while len(self._entries)>self.limit:
+			self._entries.popitem(last=False)
+
+	def discard(self,key):
+		self._entries.pop(key,None)
+
+	def clear(self):
+		self._entries.clear()
+
+class Message:
+
+	# One parsed line from the server. The prefix is split into
+	# nickname, username and host (and kept whole as hostmask);
+	# params holds every parameter, with the trailing parameter (if
+	# any) last. Tags are parsed the first time they're wanted, since
+	# most lines' never are
+	__slots__ = ("line","_tags","prefix","hostmask","nickname","username","host","command","params")
+
+	def __init__(self,line,tags,prefix,command,params):
+		self.line = line
+		self._tags = tags
+		self.prefix = prefix
+		self.command = command
+		self.params = params
+
+		if prefix:
+			self.hostmask = parse_hostmask(prefix)
+			self.nickname, self.username, self.host = self.hostmask
+		else:
+			self.hostmask = None
+			self.nickname = None
+			self.username = None
+			self.host = None
+
+	@property
+	def tags(self):
+		tags = self._tags
+		if tags.__class__ is str:
+			tags = parse_tags(tags)
+			self._tags = tags
+		return tags
+
+	@property
+	def userhost(self):
+		# Everything after the "!" in the prefix, or None
+		if self.hostmask==None: return None
+		return self.hostmask.userhost
+
+	def __repr__(self):
+		return f"Message({self.line!r})"
+
+class Hostmask(namedtuple("Hostmask",("nickname","username","host"))):
+
+	# "nick!user@host", split; missing parts are None
+
+	__slots__ = ()
+
+	@property
+	def userhost(self):
+		# Everything after the "!", or None
+		if self.username==None: return None
+		if self.host==None: return self.username
+		return self.username + "@" + self.host
+
+# The same few thousand prefixes make up nearly all of a busy
+# connection's traffic, so parsed ones are kept; the parts are
+# interned, so every message from a user shares one copy of each
+HOSTMASK_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=HOSTMASK_CACHE_SIZE)
+def parse_hostmask(mask):
+	# Returns the Hostmask for "nick!user@host"; see split_hostmask()
+	nickname, username, host = split_hostmask(mask)
+	return Hostmask(
+		sys.intern(nickname),
+		sys.intern(username) if username!=None else None,
+		sys.intern(host) if host!=None else None
+	)
+
+def split_hostmask(mask):
+	# Splits "nick!user@host" into (nick,user,host); missing parts
+	# are None
+	user = None
+	host = None
+	at = mask.find("@")
+	if at!=-1:
+		host = mask[at+1:]
+		mask = mask[:at]
+	bang = mask.find("!")
+	if bang!=-1:
+		user = mask[bang+1:]
+		mask = mask[:bang]
+	return mask, user, host
+
+class User:
+
+	# A user sharing at least one channel with the client. channels
+	# holds the (folded) names of those channels; account and away
+	# are only known with the IRCv3 capabilities that report them
+	__slots__ = ("nickname","username","host","channels","account","away")
+
+	def __init__(self,nickname,username=None,host=None):
+		self.nickname = nickname
+		self.username = username
+		self.host = host
+		self.channels = set()
+		self.account = None
+		self.away = None
+
+class Channel:
+
+	# A channel the client is in. members maps each member's folded
+	# nickname to their status prefixes ("@", "+", "@+", or "")
+	__slots__ = ("name","members")
+
+	def __init__(self,name):
+		self.name = name
+		self.members = {}
+
+class ChannelTracker:
+
+	# Keeps track of the channels the client is in, who is in them
+	# and with what status, and which channels each user is in.
+	# Every update is a few dict/set operations, independent of the
+	# size of the network; only our own PART/KICK and a NAMES reply
+	# touch every member of a channel.
+	#
+	# Nicknames are interned and the folded nickname used as a key is
+	# shared between the user index and every channel's member dict.
+	# Status prefixes are interned too, so every "@" member shares
+	# one string. On CPython 3.11 (64-bit) that works out at roughly
+	# 500 bytes per user (record, channel set, nickname, username and
+	# host) plus 150 bytes per channel membership, so 100,000 users
+	# in 100,000 memberships need about 65MB.
+
+	def __init__(self):
+		self.channels = {}
+		self.users = {}
+		self._names = {}
+		self.set_casemapping("rfc1459")
+		self.set_prefixes("(qaohv)~&@%+")
+		self.set_channel_modes("beI,k,l,imnpst")
+
+	def set_casemapping(self,casemapping):
+		# Sets how names are folded for comparison, from the ISUPPORT
+		# CASEMAPPING name; anything already tracked is re-keyed
+		self.casemapping = casemapping
+		self.fold = casefolder(casemapping)
+		if self.channels or self.users or self._names:
+			self._rekey()
+
+	def _rekey(self):
+		fold = self.fold
+		users = {}
+		for user in self.users.values():
+			users[sys.intern(fold(user.nickname))] = user
+		channels = {}
+		for chan in self.channels.values():
+			ckey = sys.intern(fold(chan.name))
+			members = {}
+			for key, status in chan.members.items():
+				user = self.users.get(key)
+				if user!=None: members[sys.intern(fold(user.nickname))] = status
+			chan.members = members
+			channels[ckey] = chan
+		for user in users.values():
+			user.channels = set(sys.intern(fold(self.channels[ckey].name)) for ckey in user.channels if ckey in self.channels)
+		names = {}
+		for ckey, pending in self._names.items():
+			names[fold(ckey)] = { fold(entry[0]): entry for entry in pending.values() }
+		self.users = users
+		self.channels = channels
+		self._names = names
+
+	def set_prefixes(self,prefix):
+		# Sets the status modes and their prefixes, in ISUPPORT PREFIX
+		# form: "(ov)@+"
+		modes, symbols = prefix[1:].split(")",1)
+		self.prefix_modes = dict(zip(modes,symbols))
+		self.prefix_rank = { s: i for i, s in enumerate(symbols) }
+
+	def set_channel_modes(self,chanmodes):
+		# Sets which channel modes take a parameter, in ISUPPORT
+		# CHANMODES form: "always,always,when set,never"
+		groups = (chanmodes.split(",") + ["","","",""])[:4]
+		self._param_always = set(groups[0] + groups[1])
+		self._param_set = set(groups[2])
+
+	def _prefix_string(self,symbols):
+		rank = self.prefix_rank
+		return sys.intern("".join(sorted(symbols,key=lambda s: rank.get(s,len(rank)))))
+
+	def _get_user(self,nickname,username=None,host=None):
+		key = self.fold(nickname)
+		user = self.users.get(key)
+		if user==None:
+			key = sys.intern(key)
+			user = User(sys.intern(nickname),username,host)
+			self.users[key] = user
+		elif username!=None:
+			user.username = username
+			user.host = host
+		return key, user
+
+	def _drop_membership(self,ckey,key):
+		user = self.users.get(key)
+		if user==None: return
+		user.channels.discard(ckey)
+		if not user.channels: del self.users[key]
+
+	def join(self,channel,nickname,username=None,host=None):
+		ckey = self.fold(channel)
+		chan = self.channels.get(ckey)
+		if chan==None:
+			ckey = sys.intern(ckey)
+			chan = Channel(channel)
+			self.channels[ckey] = chan
+		key, user = self._get_user(nickname,username,host)
+		chan.members[key] = ""
+		user.channels.add(ckey)
+
+	def part(self,channel,nickname):
+		ckey = self.fold(channel)
+		chan = self.channels.get(ckey)
+		if chan==None: return
+		key = self.fold(nickname)
+		if chan.members.pop(key,None)!=None:
+			self._drop_membership(ckey,key)
+
+	def remove_channel(self,channel):
+		# Forgets a channel the client has left
+		ckey = self.fold(channel)
+		chan = self.channels.pop(ckey,None)
+		self._names.pop(ckey,None)
+		if chan==None: return
+		for key in chan.members:
+			self._drop_membership(ckey,key)
+
+	def quit(self,nickname):
+		key = self.fold(nickname)
+		user = self.users.pop(key,None)
+		if user==None: return
+		for ckey in user.channels:
+			chan = self.channels.get(ckey)
+			if chan: chan.members.pop(key,None)
+
+	def nick(self,nickname,newnick):
+		key = self.fold(nickname)
+		user = self.users.pop(key,None)
+		if user==None: return
+		newkey = sys.intern(self.fold(newnick))
+		user.nickname = sys.intern(newnick)
+		self.users[newkey] = user
+		for ckey in user.channels:
+			members = self.channels[ckey].members
+			members[newkey] = members.pop(key,"")
+
+	def away(self,nickname,message):
+		user = self.users.get(self.fold(nickname))
+		if user: user.away = message
+
+	def account(self,nickname,account):
+		user = self.users.get(self.fold(nickname))
+		if user: user.account = account
+
+	def chghost(self,nickname,username,host):
+		user = self.users.get(self.fold(nickname))
+		if user:
+			user.username = username
+			user.host = host
+
+	def user(self,nickname):
+		return self.users.get(self.fold(nickname))
+
+	def mode(self,channel,modes,args):
+		chan = self.channels.get(self.fold(channel))
+		if chan==None: return
+		adding = True
+		index = 0
+		for mode in modes:
+			if mode=="+":
+				adding = True
+			elif mode=="-":
+				adding = False
+			elif mode in self.prefix_modes:
+				if index>=len(args): return
+				key = self.fold(args[index])
+				index = index + 1
+				status = chan.members.get(key)
+				if status==None: continue
+				symbol = self.prefix_modes[mode]
+				if adding:
+					if symbol not in status:
+						chan.members[key] = self._prefix_string(status+symbol)
+				elif symbol in status:
+					chan.members[key] = sys.intern(status.replace(symbol,""))
+			elif mode in self._param_always or (adding and mode in self._param_set):
+				index = index + 1
+
+	def names(self,channel,entries):
+		# Collects one NAMES reply line; the membership isn't replaced
+		# until end_names(). Entries are kept in the order the server
+		# sent them, keyed by nickname so repeats just overwrite
+		pending = self._names.setdefault(self.fold(channel),{})
+		rank = self.prefix_rank
+		fold = self.fold
+		for entry in entries:
+			i = 0
+			while i<len(entry) and entry[i] in rank: i = i + 1
+			nickname, username, host = parse_hostmask(entry[i:])
+			pending[fold(nickname)] = (nickname,username,host,entry[:i],entry)
+
+	def pending_names(self,channel):
+		# The NAMES entries collected so far, as sent by the server
+		pending = self._names.get(self.fold(channel))
+		if pending==None: return []
+		return [names[4] for names in pending.values()]
+
+	def end_names(self,channel):
+		ckey = self.fold(channel)
+		pending = self._names.pop(ckey,None)
+		chan = self.channels.get(ckey)
+		if pending==None or chan==None: return
+		members = {}
+		for nickname, username, host, status, entry in pending.values():
+			key, user = self._get_user(nickname,username,host)
+			user.channels.add(ckey)
+			members[key] = self._prefix_string(status)
+		for key in chan.members:
+			if key not in members:
+				self._drop_membership(ckey,key)
+		chan.members = members
+
+	def clear(self):
+		self.channels = {}
+		self.users = {}
+		self._names = {}
+
+	def members(self,channel):
+		chan = self.channels.get(self.fold(channel))
+		if chan==None: return []
+		users = self.users
+		return [users[key].nickname for key in chan.members if key in users]
+
+	def user_channels(self,nickname):
+		user = self.users.get(self.fold(nickname))
+		if user==None: return []
+		channels = self.channels
+		return [channels[ckey].name for ckey in user.channels if ckey in channels]
+
+	def status(self,channel,nickname):
+		# The member's status prefixes, or None if they're not in the
+		# channel
+		chan = self.channels.get(self.fold(channel))
+		if chan==None: return None
+		return chan.members.get(self.fold(nickname))
+
+	def is_op(self,channel,nickname):
+		# True for channel operators and anything ranked above them
+		status = self.status(channel,nickname)
+		if not status: return False
+		op = self.prefix_rank.get(self.prefix_modes.get("o"),0)
+		rank = self.prefix_rank
+		for symbol in status:
+			if rank.get(symbol,op+1)<=op: return True
+		return False
+
+# Translation tables for the ISUPPORT CASEMAPPING values; names are
+# folded to lower case. They're applied to the UTF-8 encoded name:
+# bytes.translate() is a plain table lookup, where str.translate()
+# does a dict lookup per character and is several times slower
+CASEMAPPINGS = {
+	"ascii": bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ",b"abcdefghijklmnopqrstuvwxyz"),
+	"rfc1459": bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ[]\\~",b"abcdefghijklmnopqrstuvwxyz{}|^"),
+	"strict-rfc1459": bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ[]\\",b"abcdefghijklmnopqrstuvwxyz{}|"),
+}
+
+def casefolder(casemapping):
+	# Returns a function that folds a name by the given casemapping;
+	# unknown ones (rfc7613 and the like) fall back to str.lower
+	table = CASEMAPPINGS.get(casemapping)
+	if table==None: return str.lower
+	def fold(name):
+		return name.encode("utf-8").translate(table).decode("utf-8")
+	return fold
+
+def unescape_isupport(value):
+	# ISUPPORT values escape characters as \xHH
+	if "\\x" not in value: return value
+	parts = value.split("\\x")
+	result = [parts[0]]
+	for part in parts[1:]:
+		try:
+			result.append(chr(int(part[:2],16)) + part[2:])
+		except ValueError:
+			result.append("\\x" + part)
+	return "".join(result)
+
+TAG_ESCAPES = { ":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n" }
+
+def unescape_tag_value(value):
+	if "\\" not in value: return value
+	output = []
+	escaped = False
+	for c in value:
+		if escaped:
+			output.append(TAG_ESCAPES.get(c,c))
+			escaped = False
+		elif c=="\\":
+			escaped = True
+		else:
+			output.append(c)
+	return "".join(output)
+
+def parse_tags(data):
+	tags = {}
+	for tag in data.split(";"):
+		if not tag: continue
+		equals = tag.find("=")
+		if equals==-1:
+			tags[tag] = ""
+		else:
+			tags[tag[:equals]] = unescape_tag_value(tag[equals+1:])
+	return tags
+
+def parse_message(line):
+	# Parses an RFC 1459 line, with optional IRCv3 message tags, into
+	# a Message. Returns None for a blank line
+	position = 0
+	length = len(line)
+
+	# Tags
+	tags = None
+	if line.startswith("@"):
+		space = line.find(" ")
+		if space==-1: return None
+		tags = line[1:space]
+		position = space + 1
+		while position<length and line[position]==" ": position = position + 1
+
+	# Prefix
+	prefix = None
+	if line.startswith(":",position):
+		space = line.find(" ",position)
+		if space==-1: return None
+		prefix = line[position+1:space]
+		position = space + 1
+
+	# Command and parameters; everything after " :" is the trailing
+	# parameter, and may contain spaces
+	trailing = line.find(" :",position)
+	if trailing==-1:
+		params = line[position:].split()
+	else:
+		params = line[position:trailing].split()
+		params.append(line[trailing+2:])
+
+	if not params: return None
+	command = params.pop(0).upper()
+
+	return Message(line,tags if tags!=None else {},prefix,command,params)
+
+def emit_double_target_error(eobj,code,message):
+	params = message.params
+
+	data = {
+		"client": eobj,
+		"code": int(code),
+		"target": params[1:3],
+		"reason": params[3] if len(params)>3 else ""
+	}
+
+	eobj._emit("server_error",data)
+
+def emit_target_error(eobj,code,message):
+	params = message.params
+
+	data = {
+		"client": eobj,
+		"code": int(code),
+		"target": params[1:2],
+		"reason": params[2] if len(params)>2 else ""
+	}
+
+	eobj._emit("server_error",data)
+
+def emit_error(eobj,code,message):
+	params = message.params
+	if len(params)>=2:
+		reason = params[-1]
+	else:
+		reason = "Unknown error"
+
+	data = {
+		"client": eobj,
+		"code": int(code),
+		"target": [],
+		"reason": reason
+	}
+
+	eobj._emit("server_error",data)
+
+def emit_unknown_error(eobj,code,message):
+	data = {
+		"client": eobj,
+		"code": int(code),
+		"target": [],
+		"reason": "Unknown error"
+	}
+
+	eobj._emit("server_error",data)
+
+# Error numerics, and the function that turns each one into a
+# server_error signal
+ERRORS = {
+	"400": emit_unknown_error,
+	"401": emit_target_error,
+	"402": emit_target_error,
+	"403": emit_target_error,
+	"404": emit_target_error,
+	"405": emit_target_error,
+	"406": emit_target_error,
+	"407": emit_target_error,
+	"409": emit_error,
+	"411": emit_error,
+	"412": emit_error,
+	"413": emit_target_error,
+	"414": emit_target_error,
+	"415": emit_target_error,
+	"421": emit_target_error,
+	"422": emit_error,
+	"423": emit_target_error,
+	"424": emit_error,
+	"431": emit_error,
+	"432": emit_target_error,
+	"436": emit_target_error,
+	"441": emit_double_target_error,
+	"442": emit_target_error,
+	"444": emit_target_error,
+	"445": emit_error,
+	"446": emit_error,
+	"451": emit_error,
+	"461": emit_target_error,
+	"462": emit_error,
+	"463": emit_error,
+	"464": emit_error,
+	"465": emit_error,
+	"467": emit_target_error,
+	"471": emit_target_error,
+	"472": emit_target_error,
+	"473": emit_target_error,
+	"474": emit_target_error,
+	"475": emit_target_error,
+	"476": emit_target_error,
+	"478": emit_double_target_error,
+	"481": emit_error,
+	"482": emit_target_error,
+	"483": emit_error,
+	"485": emit_error,
+	"491": emit_error,
+	"501": emit_error,
+	"502": emit_error,
+}
+
+# The longest line a server will relay, less the line ending, and the
+# longest host we assume it might give us
+MESSAGE_LENGTH = 510
+HOST_LENGTH = 63
+
+# Never split text into pieces smaller than this, however long the
+# target is; it's more than the longest encoded character
+MIN_SPLIT = 16
+
+def split_text(text,limit,encoding="utf-8"):
+	# Splits text into pieces of at most limit bytes once encoded,
+	# one or more per line of text, breaking at spaces where possible
+	# and never inside a character. Blank lines, and pieces that
+	# would be nothing but spaces, are skipped
+	pieces = []
+	utf8 = codecs.lookup(encoding).name=="utf-8"
+	for line in text.replace("\r\n","\n").replace("\r","\n").split("\n"):
+		if not line: continue
+		if utf8:
+			split_utf8(line,limit,pieces)
+		else:
+			split_encoded(line,limit,encoding,pieces)
+	return [piece for piece in pieces if piece.strip(" ")]
+
+def split_utf8(line,limit,pieces):
+	# Works on the encoded bytes: a space byte is always a space, and
+	# continuation bytes all look like 10xxxxxx
+	data = line.encode("utf-8")
+	start = 0
+	while len(data)-start>limit:
+		end = start + limit
+		space = data.rfind(b" ",start+1,end+1)
+		if space!=-1:
+			pieces.append(data[start:space].decode("utf-8"))
+			start = space + 1
+		else:
+			while data[end] & 0xC0==0x80: end = end - 1
+			pieces.append(data[start:end].decode("utf-8"))
+			start = end
+	if start<len(data):
+		pieces.append(data[start:].decode("utf-8"))
+
+def split_encoded(line,limit,encoding,pieces):
+	# Any other encoding: find the longest run of characters that
+	# fits by bisection; every character is at least one byte
+	while len(line.encode(encoding))>limit:
+		low = 1
+		high = min(len(line),limit)
+		while low<high:
+			middle = (low + high + 1)//2
+			if len(line[:middle].encode(encoding))<=limit:
+				low = middle
+			else:
+				high = middle - 1
+		space = line.rfind(" ",1,low+1)
+		if space!=-1:
+			pieces.append(line[:space])
+			line = line[space+1:]
+		else:
+			pieces.append(line[:low])
+			line = line[low:]
+	if line:
+		pieces.append(line)
+
+# The IRCv3 capabilities requested when the server offers them
+WANTED_CAPS = [
+	"multi-prefix",
+	"userhost-in-names",
+	"away-notify",
+	"account-notify",
+	"extended-join",
+	"chghost",
+	"message-tags",
+	"server-time",
+	"batch",
+	"cap-notify",
+]
+
+def message_time(message):
+	# When the message was sent: the server-time tag if there is
+	# one, otherwise now. Returns seconds since the epoch
+	if message.tags and "time" in message.tags:
+		try:
+			return datetime.datetime.fromisoformat(message.tags["time"].replace("Z","+00:00")).timestamp()
+		except ValueError:
+			pass
+	return time.time()
+
+# Errors that mean a JOIN failed; the channel is the first target
+
+def join_lines(channels,limit=510,max_targets=0):
+	# Packs (channel,key) pairs into as few JOIN lines as fit in limit
+	# bytes, and max_targets channels (if set), each. Keyed channels
+	# go first, since the keys are matched to the channels in order
+	channels = [c for c in channels if c[1]] + [c for c in channels if not c[1]]
+	lines = []
+	names = []
+	keys = []
+	size = 5
+	for channel, key in channels:
+		extra = len(channel.encode("utf-8")) + 1
+		if key: extra = extra + len(key.encode("utf-8")) + 1
+		if names and (size + extra>limit or (max_targets and len(names)>=max_targets)):
+			lines.append("JOIN " + ",".join(names) + (" " + ",".join(keys) if keys else ""))
+			names = []
+			keys = []
+			size = 5
+		names.append(channel)
+		if key: keys.append(key)
+		size = size + extra
+	if names:
+		lines.append("JOIN " + ",".join(names) + (" " + ",".join(keys) if keys else ""))
+	return lines
+
+def normalize_command(command):
+	# Dispatch table key for a command or numeric
+	if isinstance(command,int):
+		return "%03d" % command
+	return str(command).upper()
+
+def handle_errors(eobj,line):
+
+	message = parse_message(line)
+	if message==None: return False
+
+	shape = ERRORS.get(message.command)
+	if shape==None: return False
+
+	shape(eobj,message.command,message)
+	return True
@@ -0,0 +1,299 @@
+#
+#  QIRC Chat Log
+#  Copyright (C) 2019  Daniel Hetrick
+#               _   _       _                         
+#              | | (_)     | |                        
+#   _ __  _   _| |_ _  ___ | |__                      
+#  | '_ \| | | | __| |/ _ \| '_ \                     
+#  | | | | |_| | |_| | (_) | |_) |                    
+#  |_| |_|\__,_|\__| |\___/|_.__/ _                   
+#  | |     | |    _/ |           | |                  
+#  | | __ _| |__ |__/_  _ __ __ _| |_ ___  _ __ _   _ 
+#  | |/ _` | '_ \ / _ \| '__/ _` | __/ _ \| '__| | | |
+#  | | (_| | |_) | (_) | | | (_| | || (_) | |  | |_| |
+#  |_|\__,_|_.__/ \___/|_|  \__,_|\__\___/|_|   \__, |
+#                                                __/ |
+#                                               |___/ 
+#  https://github.com/nutjob-laboratories
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import time
+import mmap
+import struct
+import threading
+import urllib.parse
+from collections import namedtuple, OrderedDict
+
+# One logged event. kind is PRIVMSG, ACTION, JOIN, PART or QUIT;
+# channel is the channel, or the other user for a private message
+LogRecord = namedtuple("LogRecord",("time","kind","channel","nickname","host","text"))
+
+# Each index entry is (time,offset of the record in the log)
+INDEX_ENTRY = struct.Struct("<dQ")
+
+class ChatLog:
+
+	# Writes chat to an append-only log per network and channel, one
+	# record per line:
+	#
+	#   time<TAB>kind<TAB>nickname<TAB>host<TAB>text
+	#
+	# with a sidecar index of fixed size (time,offset) entries. Times
+	# in the index never go backwards, so scrollback for a time range
+	# is a binary search of the memory-mapped index and one slice of
+	# the memory-mapped log; nothing is read that isn't returned.
+	#
+	#   log = ChatLog("logs")
+	#   log.attach(client)
+	#   log.scrollback("ExampleNet","#qirc",start=time.time()-3600)
+	#
+	# attach() listens on the client's events, so records are written
+	# on the client's event loop thread. scrollback() can be called
+	# from any thread.
+	#
+	# Channel and nick file names are folded by the network's
+	# CASEMAPPING, which attach() takes from the client; networks no
+	# client has been attached for fall back to lower case.
+
+	def __init__(self,directory,max_open=64,flush_interval=1):
+		self.directory = directory
+		self.max_open = max_open
+		self.flush_interval = flush_interval
+		self._files = OrderedDict()
+		self._folds = {}
+		self._lock = threading.Lock()
+		self._last_flush = time.monotonic()
+
+	def attach(self,client):
+		def network():
+			# The network's name is only known once the server has
+			# told us, so its fold is recorded as it's used
+			name = client.network or client.server or "unknown"
+			self._folds[name] = client.fold
+			return name
+
+		def message(kind):
+			def log(data):
+				channel = data["target"]
+				if client.is_me(channel): channel = data["nickname"]
+				self.write(network(),channel,kind,data["nickname"],data["host"],data["message"],data.get("time"))
+			return log
+
+		def join(data):
+			self.write(network(),data["channel"],"JOIN",data["nickname"],data["host"],"",data.get("time"))
+
+		def part(data):
+			self.write(network(),data["channel"],"PART",data["nickname"],data["host"],data["reason"],data.get("time"))
+
+		def quit(data):
+			for channel in data.get("channels",[]):
+				self.write(network(),channel,"QUIT",data["nickname"],data["host"],data["reason"],data.get("time"))
+
+		client.on("message_public",message("PRIVMSG"))
+		client.on("message_private",message("PRIVMSG"))
+		client.on("message_action",message("ACTION"))
+		client.on("user_join",join)
+		client.on("user_part",part)
+		client.on("user_quit",quit)
+		client.on("tick",lambda uptime: self._flush_due())
+
+	def write(self,network,channel,kind,nickname,host,text,when=None):
+		if when==None: when = time.time()
+		record = f"{when:.3f}\t{kind}\t{nickname}\t{host or ''}\t{text}\n".encode("utf-8","replace")
+		with self._lock:
+			log = self._open(network,channel)
+			offset = log.size
+			log.log.write(record)
+			log.size = log.size + len(record)
+
+			# Keep the index sorted, even if the server's clock isn't
+			if when<log.last_time: when = log.last_time
+			log.last_time = when
+			log.index.write(INDEX_ENTRY.pack(when,offset))
+		self._flush_due()
+
+	def _flush_due(self):
+		if time.monotonic() - self._last_flush>=self.flush_interval:
+			self.flush()
+
+	def flush(self):
+		with self._lock:
+			for log in self._files.values():
+				log.flush()
+			self._last_flush = time.monotonic()
+
+	def close(self):
+		with self._lock:
+			for log in self._files.values():
+				log.close()
+			self._files.clear()
+
+	def networks(self):
+		if not os.path.isdir(self.directory): return []
+		return sorted(unquote_name(name) for name in os.listdir(self.directory))
+
+	def channels(self,network):
+		path = os.path.join(self.directory,quote_name(network))
+		if not os.path.isdir(path): return []
+		return sorted(unquote_name(name[:-4]) for name in os.listdir(path) if name.endswith(".log"))
+
+	def scrollback(self,network,channel,start=None,end=None,limit=None):
+		# Returns the records from start up to (but not including) end,
+		# both times in seconds since the epoch and optional, oldest
+		# first; with a limit, only the last limit of them
+		path = self._path(network,channel)
+		if not os.path.exists(path+".log"): return []
+
+		# Opening the log checks its index, and flushing it makes what's
+		# been written so far visible
+		with self._lock:
+			self._open(network,channel).flush()
+
+		with open(path+".idx","rb") as index_file, open(path+".log","rb") as log_file:
+			index_size = os.fstat(index_file.fileno()).st_size // INDEX_ENTRY.size
+			log_size = os.fstat(log_file.fileno()).st_size
+			if index_size==0 or log_size==0: return []
+
+			with mmap.mmap(index_file.fileno(),index_size*INDEX_ENTRY.size,access=mmap.ACCESS_READ) as index:
+				first = 0 if start==None else search_index(index,index_size,start)
+				last = index_size if end==None else search_index(index,index_size,end)
+				if limit!=None and last-first>limit: first = last - limit
+				if first>=last: return []
+				begin = INDEX_ENTRY.unpack_from(index,first*INDEX_ENTRY.size)[1]
+				finish = log_size if last==index_size else INDEX_ENTRY.unpack_from(index,last*INDEX_ENTRY.size)[1]
+
+			# The log may be mid-write; only return complete records
+			finish = min(finish,log_size)
+			if begin>=finish: return []
+			with mmap.mmap(log_file.fileno(),log_size,access=mmap.ACCESS_READ) as data:
+				chunk = data[begin:finish]
+				chunk = chunk[:chunk.rfind(b"\n")+1]
+
+		return [parse_record(channel,line) for line in chunk.decode("utf-8","replace").split("\n") if line]
+
+	def _path(self,network,channel):
+		fold = self._folds.get(network,str.lower)
+		return os.path.join(self.directory,quote_name(network),quote_name(fold(channel)))
+
+	def _open(self,network,channel):
+		path = self._path(network,channel)
+		log = self._files.get(path)
+		if log!=None:
+			self._files.move_to_end(path)
+			return log
+
+		os.makedirs(os.path.dirname(path),exist_ok=True)
+		log = LogFile(path)
+		self._files[path] = log
+		while len(self._files)>self.max_open:
+			path, oldest = self._files.popitem(last=False)
+			oldest.close()
+		return log
+
+class LogFile:
+
+	# An open log and its index. Opening one checks the two agree,
+	# as they may not if the process died between writing them
+
+	def __init__(self,path):
+		self.path = path
+		self.log = open(path+".log","ab")
+		self.index = open(path+".idx","ab")
+		self.size = self.log.tell()
+		self.last_time = 0
+		self._recover()
+
+	def _recover(self):
+		entry = INDEX_ENTRY.size
+		count = self.index.tell() // entry
+
+		# Find the last index entry for a complete record in the log
+		position = 0
+		with open(self.path+".idx","rb") as index, open(self.path+".log","rb") as log:
+			while count:
+				index.seek((count-1)*entry)
+				when, offset = INDEX_ENTRY.unpack(index.read(entry))
+				if offset<self.size:
+					log.seek(offset)
+					line = log.readline()
+					if line.endswith(b"\n"):
+						self.last_time = when
+						position = offset + len(line)
+						break
+				count = count - 1
+
+			# Drop the entries after it, including a partly written one
+			self.index.truncate(count*entry)
+			self.index.seek(count*entry)
+
+			# Index any complete records the index missed, and drop a
+			# partly written last record
+			log.seek(position)
+			for line in log:
+				if not line.endswith(b"\n"): break
+				try:
+					when = float(line.split(b"\t",1)[0])
+				except ValueError:
+					when = self.last_time
+				if when<self.last_time: when = self.last_time
+				self.last_time = when
+				self.index.write(INDEX_ENTRY.pack(when,position))
+				position = position + len(line)
+
+		if position!=self.size:
+			self.log.truncate(position)
+			self.log.seek(position)
+			self.size = position
+		self.flush()
+
+	def flush(self):
+		# The log first, so the index never points past it
+		self.log.flush()
+		self.index.flush()
+
+	def close(self):
+		self.flush()
+		self.log.close()
+		self.index.close()
+
+def search_index(index,count,when):
+	# The first entry at or after when
+	low = 0
+	high = count
+	unpack = INDEX_ENTRY.unpack_from
+	size = INDEX_ENTRY.size
+	while low<high:
+		middle = (low + high) // 2
+		if unpack(index,middle*size)[0]<when:
+			low = middle + 1
+		else:
+			high = middle
+	return low
+
+def parse_record(channel,line):
+	when, kind, nickname, host, text = line.split("\t",4)
+	return LogRecord(float(when),kind,channel,nickname,host or None,text)
+
+def quote_name(name):
+	# Network and channel names as safe file names; a leading dot is
+	# quoted too, so a name can't be "." or ".." or hidden
+	name = urllib.parse.quote(name,safe="#&+!-_.@")
+	if name.startswith("."): name = "%2E" + name[1:]
+	return name
+
+def unquote_name(name):
+	return urllib.parse.unquote(name)
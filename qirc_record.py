@@ -0,0 +1,208 @@
+#
+#  QIRC Traffic Recorder
+#  Copyright (C) 2019  Daniel Hetrick
+#               _   _       _                         
+#              | | (_)     | |                        
+#   _ __  _   _| |_ _  ___ | |__                      
+#  | '_ \| | | | __| |/ _ \| '_ \                     
+#  | | | | |_| | |_| | (_) | |_) |                    
+#  |_| |_|\__,_|\__| |\___/|_.__/ _                   
+#  | |     | |    _/ |           | |                  
+#  | | __ _| |__ |__/_  _ __ __ _| |_ ___  _ __ _   _ 
+#  | |/ _` | '_ \ / _ \| '__/ _` | __/ _ \| '__| | | |
+#  | | (_| | |_) | (_) | | | (_| | || (_) | |  | |_| |
+#  |_|\__,_|_.__/ \___/|_|  \__,_|\__\___/|_|   \__, |
+#                                                __/ |
+#                                               |___/ 
+#  https://github.com/nutjob-laboratories
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import sys
+import time
+import struct
+import asyncio
+import threading
+
+MAGIC = b"QIRCREC1"
+
+# Each record is (kind,seconds since recording started,length of
+# data), then the data
+RECORD_HEADER = struct.Struct("<BdI")
+
+CONNECTED = 1
+RECEIVED = 2
+SENT = 3
+DISCONNECTED = 4
+
+class Recorder:
+
+	# Records a client's raw traffic: every chunk read from the server
+	# as it arrived, every write to it, and connects and disconnects,
+	# with monotonic timestamps. Set the record setting to a file name
+	# to record a client:
+	#
+	#   client = IRCClient(server="irc.example.com",record="session.qrec")
+	#
+	# Only ever called from the client's event loop thread.
+
+	def __init__(self,path):
+		self.path = path
+		self._file = open(path,"wb")
+		self._file.write(MAGIC)
+		self._start = time.monotonic()
+
+	def connected(self):
+		self._write(CONNECTED,b"")
+
+	def received(self,data):
+		self._write(RECEIVED,data)
+
+	def sent(self,data):
+		self._write(SENT,data)
+
+	def disconnected(self):
+		self._write(DISCONNECTED,b"")
+		self.flush()
+
+	def _write(self,kind,data):
+		self._file.write(RECORD_HEADER.pack(kind,time.monotonic()-self._start,len(data)))
+		self._file.write(data)
+
+	def flush(self):
+		self._file.flush()
+
+	def close(self):
+		self._file.close()
+
+def read_recording(path):
+	# Yields (kind,time,data) for each record; a record cut short by
+	# a crash ends the recording
+	with open(path,"rb") as f:
+		if f.read(len(MAGIC))!=MAGIC:
+			raise ValueError(f"{path} is not a QIRC recording")
+		while True:
+			header = f.read(RECORD_HEADER.size)
+			if len(header)<RECORD_HEADER.size: return
+			kind, when, length = RECORD_HEADER.unpack(header)
+			data = f.read(length)
+			if len(data)<length: return
+			yield kind, when, data
+
+class ReplayTransport(asyncio.Transport):
+
+	# Stands in for the server connection: takes and counts writes,
+	# and remembers whether the client paused reading
+
+	def __init__(self):
+		super().__init__()
+		self.paused = False
+		self.closed = False
+		self.written = 0
+		self.writes = 0
+
+	def write(self,data):
+		self.written = self.written + len(data)
+		self.writes = self.writes + 1
+
+	def pause_reading(self):
+		self.paused = True
+
+	def resume_reading(self):
+		self.paused = False
+
+	def is_reading(self):
+		return not self.paused
+
+	def close(self):
+		self.closed = True
+
+	def is_closing(self):
+		return self.closed
+
+	def get_extra_info(self,name,default=None):
+		return default
+
+async def replay(client,path,realtime=False,speed=1):
+	# Feeds a recording through the client's parsing and dispatch
+	# just as if it were coming from the server, on the running
+	# event loop, and returns (chunks,bytes,seconds). With realtime,
+	# chunks arrive at the recorded pace (sped up by speed); without,
+	# as fast as the client can take them. What the client sends
+	# goes nowhere.
+	loop = asyncio.get_running_loop()
+	client._loop = loop
+	client._loop_thread = threading.get_ident()
+	client._active = True
+	client._closed = loop.create_future()
+
+	chunks = 0
+	received = 0
+	transport = None
+	start = loop.time()
+	for kind, when, data in read_recording(path):
+		if realtime:
+			delay = start + when/speed - loop.time()
+			if delay>0: await asyncio.sleep(delay)
+
+		if kind==CONNECTED:
+			transport = ReplayTransport()
+			client._connection_made(transport)
+
+		elif kind==RECEIVED and transport!=None:
+			chunks = chunks + 1
+			received = received + len(data)
+			view = memoryview(data)
+			while view:
+				count = min(len(view),len(client._read_view))
+				client._read_view[:count] = view[:count]
+				view = view[count:]
+				client._data_received(count)
+
+				# Let a paused client catch up, as it would by not
+				# reading the socket
+				while transport.paused:
+					await asyncio.sleep(0)
+
+		elif kind==DISCONNECTED and transport!=None:
+			# Replayed as a close; the recording can't say whether
+			# the client quit or was dropped
+			client._active = False
+			client._connection_lost(None)
+			client._active = True
+			transport = None
+
+	client._active = False
+	if transport!=None: client._connection_lost(None)
+	return chunks, received, loop.time() - start
+
+if __name__ == '__main__':
+
+	# python qirc_record.py RECORDING [SPEED]: replays a recording as
+	# fast as possible, or at SPEED times the recorded pace
+	from qirc_core import IRCClient
+
+	path = sys.argv[1]
+	speed = float(sys.argv[2]) if len(sys.argv)>2 else None
+
+	client = IRCClient(server="replay",nickname="qirc",flood_protection=False)
+	events = [0]
+	def count(data):
+		events[0] = events[0] + 1
+	for event in ("message_public", "message_private", "message_action", "user_join", "user_part", "user_quit", "user_nick", "user_list"):
+		client.on(event,count)
+
+	chunks, received, elapsed = asyncio.run(replay(client,path,speed!=None,speed or 1))
+	print(f"{chunks} chunks, {received/1024:.1f} KB, {events[0]} events in {elapsed:.3f}s: {received/elapsed/1024/1024:.2f} MB/s")
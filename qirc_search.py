@@ -0,0 +1,481 @@
+#
+#  QIRC Chat Search
+#  Copyright (C) 2019  Daniel Hetrick
+#               _   _       _                         
+#              | | (_)     | |                        
+#   _ __  _   _| |_ _  ___ | |__                      
+#  | '_ \| | | | __| |/ _ \| '_ \                     
+#  | | | | |_| | |_| | (_) | |_) |                    
+#  |_| |_|\__,_|\__| |\___/|_.__/ _                   
+#  | |     | |    _/ |           | |                  
+#  | | __ _| |__ |__/_  _ __ __ _| |_ ___  _ __ _   _ 
+#  | |/ _` | '_ \ / _ \| '__/ _` | __/ _ \| '__| | | |
+#  | | (_| | |_) | (_) | | | (_| | || (_) | |  | |_| |
+#  |_|\__,_|_.__/ \___/|_|  \__,_|\__\___/|_|   \__, |
+#                                                __/ |
+#                                               |___/ 
+#  https://github.com/nutjob-laboratories
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import mmap
+import time
+import bisect
+import threading
+from array import array
+from collections import namedtuple
+
+from qirc_log import INDEX_ENTRY, search_index
+
+# One message found by a search. channel is the channel, or the
+# other user for a private message
+SearchResult = namedtuple("SearchResult",("time","network","channel","nickname","text"))
+
+WORD = re.compile(r"\w+")
+MAX_TOKEN_LENGTH = 64
+
+class SearchIndex:
+
+	# An inverted index of chat messages, from each word to the
+	# messages it's in:
+	#
+	#   index = SearchIndex("search")
+	#   index.attach(client)
+	#   index.search("release notes",channel="#qirc",network="ExampleNet")
+	#
+	# New messages go into an in-memory segment. Once that has
+	# segment_size messages, or flush_interval seconds have passed,
+	# it's handed to a background thread that writes it to disk as an
+	# immutable segment, and merges merge_factor segments of the same
+	# size into one so a search only has to look in a few. Searches
+	# look at a snapshot of the segment list, so they never wait for
+	# a merge; search() can be called from any thread.
+	#
+	# Nicknames, channels and networks are indexed as words of their
+	# own ("nick:...", "channel:...", "network:..."), which the word
+	# pattern can't produce from message text, so filtering by them
+	# is the same intersection of postings as matching a word.
+	# Channels and nicks are folded by the network's CASEMAPPING,
+	# which attach() takes from the client, or lower cased for a
+	# network no client has been attached for.
+
+	def __init__(self,directory,segment_size=10000,merge_factor=8,flush_interval=60):
+		self.directory = directory
+		self.segment_size = segment_size
+		self.merge_factor = merge_factor
+		self.flush_interval = flush_interval
+
+		self._lock = threading.Lock()
+		self._manifest_lock = threading.Lock()
+		self._work = threading.Condition(self._lock)
+		self._folds = {}
+		self._segments = []
+		self._pending = []
+		self._buffer = MemorySegment()
+		self._last_time = 0
+		self._last_flush = time.monotonic()
+		self._sequence = 0
+		self._worker = None
+		self._closing = False
+
+		os.makedirs(directory,exist_ok=True)
+		self._load()
+
+	def attach(self,client):
+		def network():
+			name = client.network or client.server or "unknown"
+			self._folds[name] = client.fold
+			return name
+
+		def message(data):
+			channel = data["target"]
+			if client.is_me(channel): channel = data["nickname"]
+			self.add(network(),channel,data["nickname"],data["message"],data.get("time"))
+
+		client.on("message_public",message)
+		client.on("message_private",message)
+		client.on("message_action",message)
+		client.on("tick",lambda uptime: self._flush_due())
+
+	def add(self,network,channel,nickname,text,when=None):
+		if when==None: when = time.time()
+		text = text.replace("\n"," ")
+		tokens = set(tokenize(text))
+		tokens.update(filter_tokens(network,channel,nickname,self._folds.get(network,str.lower)))
+		with self._lock:
+			# Keep times in order, even if the server's clock isn't
+			if when<self._last_time: when = self._last_time
+			self._last_time = when
+			self._buffer.add(SearchResult(when,network,channel,nickname,text),tokens)
+			full = self._buffer.count>=self.segment_size
+		if full: self.flush()
+
+	def search(self,query="",network=None,channel=None,nickname=None,start=None,end=None,limit=50):
+		# Returns up to limit messages with every word in query, from
+		# start up to (but not including) end, newest first
+		tokens = list(set(tokenize(query)))
+		tokens.extend(filter_tokens(network,channel,nickname,self._folds.get(network,str.lower)))
+
+		with self._lock:
+			segments = self._segments + self._pending
+			results = self._buffer.search(tokens,start,end,limit)
+		for segment in reversed(segments):
+			if len(results)>=limit: break
+			results.extend(segment.search(tokens,start,end,limit-len(results)))
+		return results
+
+	def segments(self):
+		with self._lock:
+			return [segment.count for segment in self._segments + self._pending]
+
+	def _flush_due(self):
+		if time.monotonic() - self._last_flush>=self.flush_interval:
+			self.flush()
+
+	def flush(self):
+		# Hands the in-memory segment to the background thread
+		with self._lock:
+			self._last_flush = time.monotonic()
+			if self._buffer.count==0: return
+			self._pending.append(self._buffer)
+			self._buffer = MemorySegment()
+			if self._worker==None:
+				self._worker = threading.Thread(target=self._run,daemon=True)
+				self._worker.start()
+			self._work.notify()
+
+	def close(self):
+		# Writes out everything and stops the background thread
+		self.flush()
+		with self._lock:
+			self._closing = True
+			self._work.notify()
+			worker = self._worker
+		if worker!=None: worker.join()
+		with self._lock:
+			self._worker = None
+			self._closing = False
+
+	def _run(self):
+		while True:
+			with self._lock:
+				while not self._pending and not self._closing:
+					self._work.wait()
+				if not self._pending: return
+				memory = self._pending[0]
+				name = self._next_name()
+
+			segment = write_segment(self.directory,name,memory.documents(),memory.terms())
+			with self._lock:
+				self._pending.remove(memory)
+				self._segments.append(segment)
+				names = [segment.name for segment in self._segments]
+			self._save(names)
+
+			self._merge()
+
+	def _merge(self):
+		# Merges the newest segments while merge_factor of them are
+		# the same size, like an LSM tree's tiers
+		while True:
+			with self._lock:
+				run = self._segments[-self.merge_factor:]
+				if len(run)<self.merge_factor: return
+				if len(set(self._tier(segment.count) for segment in run))>1: return
+				name = self._next_name()
+
+			merged = merge_segments(self.directory,name,run)
+			with self._lock:
+				first = self._segments.index(run[0])
+				self._segments[first:first+len(run)] = [merged]
+				names = [segment.name for segment in self._segments]
+			self._save(names)
+			for segment in run:
+				segment.remove()
+
+	def _tier(self,count):
+		tier = 0
+		while count>self.segment_size*self.merge_factor**tier:
+			tier = tier + 1
+		return tier
+
+	def _next_name(self):
+		self._sequence = self._sequence + 1
+		return f"{self._sequence:08d}"
+
+	def _load(self):
+		# The manifest lists the live segments, oldest first; anything
+		# else in the directory was left by a crash or a merge whose
+		# old segments couldn't be removed yet
+		manifest = os.path.join(self.directory,"segments")
+		names = []
+		if os.path.exists(manifest):
+			with open(manifest) as f:
+				names = [line.strip() for line in f if line.strip()]
+		for name in names:
+			self._segments.append(DiskSegment(self.directory,name))
+
+		for file in os.listdir(self.directory):
+			name, extension = os.path.splitext(file)
+			if not name.isdigit(): continue
+			self._sequence = max(self._sequence,int(name))
+			if name not in names:
+				try:
+					os.remove(os.path.join(self.directory,file))
+				except OSError:
+					pass
+
+		if self._segments:
+			last = self._segments[-1]
+			self._last_time = last.time(last.count-1)
+
+	def _save(self,names):
+		# Written without holding _lock, so add() and search() don't
+		# wait on the disk
+		manifest = os.path.join(self.directory,"segments")
+		with self._manifest_lock:
+			with open(manifest+".tmp","w") as f:
+				for name in names:
+					f.write(name + "\n")
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(manifest+".tmp",manifest)
+
+class MemorySegment:
+
+	# Messages not yet written to disk
+
+	def __init__(self):
+		self.count = 0
+		self._documents = []
+		self._times = []
+		self._terms = {}
+
+	def add(self,document,tokens):
+		number = self.count
+		self._documents.append(document)
+		self._times.append(document.time)
+		for token in tokens:
+			postings = self._terms.get(token)
+			if postings==None:
+				self._terms[token] = [number]
+			else:
+				postings.append(number)
+		self.count = self.count + 1
+
+	def documents(self):
+		return self._documents
+
+	def terms(self):
+		return self._terms
+
+	def postings(self,token):
+		return self._terms.get(token,())
+
+	def time_range(self,start,end):
+		first = 0 if start==None else bisect.bisect_left(self._times,start)
+		last = self.count if end==None else bisect.bisect_left(self._times,end)
+		return first, last
+
+	def document(self,number):
+		return self._documents[number]
+
+	def search(self,tokens,start,end,limit):
+		return search_segment(self,tokens,start,end,limit)
+
+class DiskSegment:
+
+	# A segment written by write_segment(), as four files:
+	#
+	#   .docs   one message per line, time<TAB>network<TAB>channel<TAB>nickname<TAB>text
+	#   .dix    (time,offset) of each message in .docs
+	#   .post   every word's postings, ascending message numbers
+	#   .terms  word<TAB>first posting<TAB>number of postings, per line
+	#
+	# .docs, .dix and .post are memory-mapped, so only the words and
+	# their posting ranges are held in memory
+
+	def __init__(self,directory,name):
+		self.directory = directory
+		self.name = name
+		path = os.path.join(directory,name)
+
+		self._terms = {}
+		with open(path+".terms","rb") as f:
+			for line in f:
+				token, first, count = line.rstrip(b"\n").split(b"\t")
+				self._terms[token.decode("utf-8")] = (int(first),int(count))
+
+		self._docs = map_file(path+".docs")
+		self._dix = map_file(path+".dix")
+		self._post = map_file(path+".post")
+		self.count = len(self._dix) // INDEX_ENTRY.size
+
+	def postings(self,token):
+		entry = self._terms.get(token)
+		if entry==None: return ()
+		first, count = entry
+		return memoryview(self._post)[first*4:(first+count)*4].cast("I")
+
+	def time(self,number):
+		return INDEX_ENTRY.unpack_from(self._dix,number*INDEX_ENTRY.size)[0]
+
+	def time_range(self,start,end):
+		first = 0 if start==None else search_index(self._dix,self.count,start)
+		last = self.count if end==None else search_index(self._dix,self.count,end)
+		return first, last
+
+	def document(self,number):
+		begin = INDEX_ENTRY.unpack_from(self._dix,number*INDEX_ENTRY.size)[1]
+		if number+1<self.count:
+			finish = INDEX_ENTRY.unpack_from(self._dix,(number+1)*INDEX_ENTRY.size)[1]
+		else:
+			finish = len(self._docs)
+		return parse_document(self._docs[begin:finish])
+
+	def documents(self):
+		for number in range(self.count):
+			yield self.document(number)
+
+	def terms(self):
+		return self._terms
+
+	def search(self,tokens,start,end,limit):
+		return search_segment(self,tokens,start,end,limit)
+
+	def remove(self):
+		# Searches that still have this segment keep their maps; on
+		# systems that won't remove mapped files, _load() removes them
+		# next time
+		for extension in (".docs",".dix",".post",".terms"):
+			try:
+				os.remove(os.path.join(self.directory,self.name+extension))
+			except OSError:
+				pass
+
+def search_segment(segment,tokens,start,end,limit):
+	# The newest limit messages in the segment with every token
+	first, last = segment.time_range(start,end)
+	if first>=last or limit<=0: return []
+
+	if not tokens:
+		return [segment.document(number) for number in range(last-1,max(first,last-limit)-1,-1)]
+
+	lists = []
+	for token in tokens:
+		postings = segment.postings(token)
+		if not postings: return []
+		lists.append(postings)
+	lists.sort(key=len)
+
+	# Walk the shortest list backwards, looking the rest up by bisection
+	shortest = lists[0]
+	results = []
+	index = bisect.bisect_left(shortest,last) - 1
+	while index>=0 and len(results)<limit:
+		number = shortest[index]
+		if number<first: break
+		for postings in lists[1:]:
+			found = bisect.bisect_left(postings,number)
+			if found==len(postings) or postings[found]!=number: break
+		else:
+			results.append(segment.document(number))
+		index = index - 1
+	return results
+
+def write_segment(directory,name,documents,terms):
+	path = os.path.join(directory,name)
+	with open(path+".docs.tmp","wb") as docs, open(path+".dix.tmp","wb") as dix:
+		offset = 0
+		for document in documents:
+			record = format_document(document)
+			docs.write(record)
+			dix.write(INDEX_ENTRY.pack(document.time,offset))
+			offset = offset + len(record)
+	write_terms(path,terms)
+	return finish_segment(directory,name)
+
+def merge_segments(directory,name,segments):
+	# Message numbers in each segment move up by the number of
+	# messages in the segments before it
+	path = os.path.join(directory,name)
+	with open(path+".docs.tmp","wb") as docs, open(path+".dix.tmp","wb") as dix:
+		offset = 0
+		for segment in segments:
+			for number in range(segment.count):
+				when, start = INDEX_ENTRY.unpack_from(segment._dix,number*INDEX_ENTRY.size)
+				dix.write(INDEX_ENTRY.pack(when,start+offset))
+			docs.write(segment._docs)
+			offset = offset + len(segment._docs)
+
+	terms = {}
+	base = 0
+	for segment in segments:
+		for token in segment.terms():
+			postings = segment.postings(token)
+			if base:
+				postings = array("I",(number+base for number in postings))
+			else:
+				postings = array("I",postings)
+			merged = terms.get(token)
+			if merged==None:
+				terms[token] = postings
+			else:
+				merged.extend(postings)
+		base = base + segment.count
+	write_terms(path,terms)
+	return finish_segment(directory,name)
+
+def write_terms(path,terms):
+	with open(path+".terms.tmp","wb") as listing, open(path+".post.tmp","wb") as post:
+		first = 0
+		for token in sorted(terms):
+			postings = terms[token]
+			if not isinstance(postings,array): postings = array("I",postings)
+			postings.tofile(post)
+			listing.write(f"{token}\t{first}\t{len(postings)}\n".encode("utf-8"))
+			first = first + len(postings)
+
+def finish_segment(directory,name):
+	# Segments are written under temporary names and only renamed
+	# once complete; they're live once they're in the manifest
+	path = os.path.join(directory,name)
+	for extension in (".docs",".dix",".post",".terms"):
+		os.replace(path+extension+".tmp",path+extension)
+	return DiskSegment(directory,name)
+
+def map_file(path):
+	with open(path,"rb") as f:
+		if os.fstat(f.fileno()).st_size==0: return b""
+		return mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+
+def format_document(document):
+	return f"{document.time:.3f}\t{document.network}\t{document.channel}\t{document.nickname}\t{document.text}\n".encode("utf-8","replace")
+
+def parse_document(data):
+	when, network, channel, nickname, text = data.decode("utf-8","replace").rstrip("\n").split("\t",4)
+	return SearchResult(float(when),network,channel,nickname,text)
+
+def tokenize(text):
+	return [word for word in WORD.findall(text.lower()) if len(word)<=MAX_TOKEN_LENGTH]
+
+def filter_tokens(network=None,channel=None,nickname=None,fold=str.lower):
+	tokens = []
+	if network!=None: tokens.append("network:" + network.lower())
+	if channel!=None: tokens.append("channel:" + fold(channel))
+	if nickname!=None: tokens.append("nick:" + fold(nickname))
+	return tokens
@@ -0,0 +1,145 @@
+#
+#  QIRC Statistics Exporter
+#  Copyright (C) 2019  Daniel Hetrick
+#               _   _       _                         
+#              | | (_)     | |                        
+#   _ __  _   _| |_ _  ___ | |__                      
+#  | '_ \| | | | __| |/ _ \| '_ \                     
+#  | | | | |_| | |_| | (_) | |_) |                    
+#  |_| |_|\__,_|\__| |\___/|_.__/ _                   
+#  | |     | |    _/ |           | |                  
+#  | | __ _| |__ |__/_  _ __ __ _| |_ ___  _ __ _   _ 
+#  | |/ _` | '_ \ / _ \| '__/ _` | __/ _ \| '__| | | |
+#  | | (_| | |_) | (_) | | | (_| | || (_) | |  | |_| |
+#  |_|\__,_|_.__/ \___/|_|  \__,_|\__\___/|_|   \__, |
+#                                                __/ |
+#                                               |___/ 
+#  https://github.com/nutjob-laboratories
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# (name,stats() key,type,help) for the plain numbers in stats()
+METRICS = (
+	("qirc_up", "connected", "gauge", "Whether the client is connected"),
+	("qirc_uptime_seconds", "uptime", "counter", "Seconds since the client was created"),
+	("qirc_received_bytes_total", "bytes_received", "counter", "Bytes read from the server"),
+	("qirc_received_lines_total", "lines_received", "counter", "Lines read from the server"),
+	("qirc_sent_bytes_total", "bytes_sent", "counter", "Bytes written to the server"),
+	("qirc_sent_lines_total", "lines_sent", "counter", "Lines written to the server"),
+	("qirc_writes_total", "writes", "counter", "Writes to the transport"),
+	("qirc_queue_depth", "queue_depth", "gauge", "Messages waiting in the send queue"),
+	("qirc_receive_buffer_bytes", "receive_buffer", "gauge", "Bytes received but not yet dispatched"),
+	("qirc_reconnects_total", "reconnects", "counter", "Times the client has reconnected"),
+	("qirc_reconnect_attempt", "reconnect_attempt", "gauge", "Reconnection attempts since the last registration"),
+	("qirc_last_downtime_seconds", "last_downtime", "gauge", "How long the last reconnection took"),
+)
+
+# (name,stats() key,help) for the histograms
+HISTOGRAMS = (
+	("qirc_parse_seconds", "parse_time", "Time to parse a line"),
+	("qirc_dispatch_seconds", "dispatch_time", "Time to handle a parsed line"),
+	("qirc_queue_wait_seconds", "queue_wait", "Time messages spent in the send queue"),
+)
+
+class StatsExporter:
+
+	# Serves the stats() of one or more clients in the Prometheus text
+	# format, at /metrics on a local port, from a thread of its own.
+	# clients is a list, or something to call for one, such as a
+	# ConnectionManager's clients:
+	#
+	#   exporter = StatsExporter(manager.clients,9100)
+	#   exporter.start()
+
+	def __init__(self,clients,port=9100,host="127.0.0.1"):
+		self.clients = clients
+		self.port = port
+		self.host = host
+		self._server = None
+
+	def start(self):
+		exporter = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split("?")[0] not in ("/", "/metrics"):
+					self.send_error(404)
+					return
+				body = exporter.metrics().encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type","text/plain; version=0.0.4; charset=utf-8")
+				self.send_header("Content-Length",str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self,format,*args):
+				pass
+
+		self._server = ThreadingHTTPServer((self.host,self.port),Handler)
+		self._server.daemon_threads = True
+		self.port = self._server.server_address[1]
+		threading.Thread(target=self._server.serve_forever,daemon=True).start()
+
+	def stop(self):
+		if self._server!=None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+	def metrics(self):
+		clients = self.clients() if callable(self.clients) else self.clients
+		return format_metrics([client.stats() for client in clients])
+
+def format_metrics(snapshots):
+	# The Prometheus text format for a list of stats() snapshots, each
+	# labelled with its server and nickname
+	lines = []
+	for name, key, kind, text in METRICS:
+		lines.append(f"# HELP {name} {text}")
+		lines.append(f"# TYPE {name} {kind}")
+		for stats in snapshots:
+			value = stats[key]
+			if value==None: continue
+			lines.append(f"{name}{{{labels(stats)}}} {float(value)}")
+
+	lines.append("# HELP qirc_commands_total Commands and numerics received")
+	lines.append("# TYPE qirc_commands_total counter")
+	for stats in snapshots:
+		for command, count in sorted(stats["commands"].items()):
+			lines.append(f"qirc_commands_total{{{labels(stats,command=command)}}} {count}")
+
+	for name, key, text in HISTOGRAMS:
+		lines.append(f"# HELP {name} {text}")
+		lines.append(f"# TYPE {name} histogram")
+		for stats in snapshots:
+			histogram = stats[key]
+			for bound, count in histogram["buckets"]:
+				le = "+Inf" if bound==None else repr(float(bound))
+				lines.append(f"{name}_bucket{{{labels(stats,le=le)}}} {count}")
+			lines.append(f"{name}_sum{{{labels(stats)}}} {histogram['sum']}")
+			lines.append(f"{name}_count{{{labels(stats)}}} {histogram['count']}")
+
+	return "\n".join(lines) + "\n"
+
+def labels(stats,**extra):
+	values = { "server": f"{stats['server']}:{stats['port']}", "nickname": stats["nickname"] }
+	values.update(extra)
+	return ",".join(f'{key}="{escape_label(value)}"' for key, value in values.items())
+
+def escape_label(value):
+	return str(value).replace("\\","\\\\").replace('"','\\"').replace("\n","\\n")
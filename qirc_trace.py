@@ -0,0 +1,97 @@
+#
+#  QIRC Dispatch Tracer
+#  Copyright (C) 2019  Daniel Hetrick
+#               _   _       _                         
+#              | | (_)     | |                        
+#   _ __  _   _| |_ _  ___ | |__                      
+#  | '_ \| | | | __| |/ _ \| '_ \                     
+#  | | | | |_| | |_| | (_) | |_) |                    
+#  |_| |_|\__,_|\__| |\___/|_.__/ _                   
+#  | |     | |    _/ |           | |                  
+#  | | __ _| |__ |__/_  _ __ __ _| |_ ___  _ __ _   _ 
+#  | |/ _` | '_ \ / _ \| '__/ _` | __/ _ \| '__| | | |
+#  | | (_| | |_) | (_) | | | (_| | || (_) | |  | |_| |
+#  |_|\__,_|_.__/ \___/|_|  \__,_|\__\___/|_|   \__, |
+#                                                __/ |
+#                                               |___/ 
+#  https://github.com/nutjob-laboratories
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import time
+import threading
+
+from qirc_core import DispatchHook
+
+class Tracer(DispatchHook):
+
+	# Records every stage of handling incoming data as a span, and
+	# saves them as a Chrome trace-event file, which Perfetto
+	# (ui.perfetto.dev) and chrome://tracing can open. Set the trace
+	# setting to a file name to trace a client:
+	#
+	#   client.configure(trace="qirc-trace.json")
+	#   ...
+	#   client.configure(trace=None)
+	#
+	# Spans nest as the stages do: a receive holds the decode, parse
+	# and dispatch of each line it completed, and a dispatch holds
+	# the emits of the events its handler sent. Once max_events spans
+	# have been recorded, the rest are dropped.
+
+	def __init__(self,path,max_events=1000000):
+		self.path = path
+		self.max_events = max_events
+		self.dropped = 0
+		self._events = []
+		self._stack = []
+		self._pid = os.getpid()
+		self._threads = {}
+
+	def before(self,stage,detail):
+		self._stack.append(time.perf_counter())
+
+	def after(self,stage,detail):
+		started = self._stack.pop()
+		if len(self._events)>=self.max_events:
+			self.dropped = self.dropped + 1
+			return
+		ended = time.perf_counter()
+
+		if stage=="dispatch":
+			name = "dispatch " + detail.command
+		elif stage=="emit":
+			name = "emit " + detail
+		else:
+			name = stage
+
+		thread = threading.get_ident()
+		if thread not in self._threads:
+			self._threads[thread] = threading.current_thread().name
+		self._events.append((name,stage,started,ended-started,thread,detail if stage=="receive" else None))
+
+	def save(self):
+		# Writes out everything recorded so far
+		events = []
+		for thread, name in self._threads.items():
+			events.append({ "name": "thread_name", "ph": "M", "pid": self._pid, "tid": thread, "args": { "name": name } })
+		for name, stage, started, duration, thread, size in list(self._events):
+			event = { "name": name, "cat": stage, "ph": "X", "ts": started*1000000, "dur": duration*1000000, "pid": self._pid, "tid": thread }
+			if size!=None: event["args"] = { "bytes": size }
+			events.append(event)
+		with open(self.path,"w") as f:
+			json.dump({ "traceEvents": events, "displayTimeUnit": "ms", "otherData": { "dropped": self.dropped } },f)